@@ -1,14 +1,19 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from myproject.admin_utils import ScalableAdminMixin
 from .models import User
+from .redis_utils import AuthBackendUnavailable, guarded_write, revoke_user_tokens
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ScalableAdminMixin, BaseUserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'user_type', 'is_staff', 'created_at')
     list_filter = ('user_type', 'is_staff', 'is_active')
-    search_fields = ('email', 'first_name', 'last_name')
+    # Also backs the author and wallet owner autocompletes
+    search_fields = ('^email', '^first_name', '^last_name')
+    search_help_text = 'Email, first name or last name prefix (case-sensitive).'
     ordering = ('-created_at',)
+    actions = ('revoke_sessions',)
 
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -22,3 +27,14 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('email', 'first_name', 'last_name', 'dob', 'user_type', 'password1', 'password2'),
         }),
     )
+
+    @admin.action(description='Revoke all sessions')
+    def revoke_sessions(self, request, queryset):
+        user_ids = list(queryset.values_list('id', flat=True))
+        try:
+            for user_id in user_ids:
+                guarded_write(revoke_user_tokens, user_id)
+        except AuthBackendUnavailable:
+            self.message_user(request, 'Redis is unavailable; sessions were not revoked.', messages.ERROR)
+            return
+        self.message_user(request, f'Revoked all sessions for {len(user_ids)} user(s).')
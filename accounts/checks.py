@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, register
+from .models import User
+
+# Field types whose values jwt.encode can serialize and User.from_db gets
+# back with the same type
+JSON_SAFE_FIELDS = {
+    'CharField', 'TextField', 'BooleanField', 'FloatField', 'IntegerField', 'SmallIntegerField',
+    'BigIntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField', 'PositiveBigIntegerField',
+}
+
+
+@register()
+def check_jwt_user_claims(app_configs, **kwargs):
+    """Every JWT_USER_CLAIMS entry must be a concrete User field with a JSON-safe value."""
+    errors = []
+    fields = {field.attname: field for field in User._meta.concrete_fields}
+    for claim in settings.JWT_USER_CLAIMS:
+        field = fields.get(claim)
+        if field is None:
+            errors.append(Error(f'JWT_USER_CLAIMS names {claim!r}, which is not a User field.', id='accounts.E001'))
+        elif field.get_internal_type() not in JSON_SAFE_FIELDS:
+            errors.append(Error(
+                f'JWT_USER_CLAIMS names {claim!r}, a {field.get_internal_type()} that JSON cannot carry unchanged.',
+                hint='Claim only string, number or boolean fields.',
+                id='accounts.E002',
+            ))
+    return errors
@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while instead of waiting on it.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail immediately with CircuitOpenError. Once `reset_timeout`
+    seconds have passed a single trial call is let through; its outcome
+    closes the circuit again or re-opens it. A trial that ends in an
+    exception outside `expected_exceptions` says nothing about the
+    dependency, so the next call gets to try instead.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, expected_exceptions=(Exception,)):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.expected_exceptions = expected_exceptions
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go through right now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Abandon a half-open trial without a verdict, leaving the next call free to try."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def call(self, func, *args, **kwargs):
+        if not self.allow():
+            raise CircuitOpenError()
+        try:
+            result = func(*args, **kwargs)
+        except self.expected_exceptions:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, func, *args, **kwargs):
+        """Async version of call() for coroutine functions."""
+        if not self.allow():
+            raise CircuitOpenError()
+        try:
+            result = await func(*args, **kwargs)
+        except self.expected_exceptions:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Includes cancellation of the awaiting task
+            self.release_trial()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
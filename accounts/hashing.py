@@ -0,0 +1,79 @@
+import threading
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class HashingUnavailable(Exception):
+    """Raised when no hashing slot frees up within PASSWORD_HASH_QUEUE_TIMEOUT."""
+
+
+class HashingLimiter:
+    """
+    Cap how many password hashes a process computes at once.
+
+    This limits hashing rather than moving it onto a pool of its own: the
+    hash runs on the calling thread once it holds one of `max_concurrent`
+    slots. A separate pool would bound concurrency the same way, but every
+    request would still block its own thread waiting for the result, so it
+    only added a thread hop. PBKDF2 releases the GIL, so up to that many
+    hashes run in parallel. A caller that can't get a slot within
+    `queue_timeout` seconds gets HashingUnavailable instead of piling more
+    CPU work onto the worker.
+    """
+
+    def __init__(self, max_concurrent, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingUnavailable('Password hashing is saturated')
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': self.in_flight, 'completed': self.completed, 'rejected': self.rejected}
+
+
+hashing_limiter = HashingLimiter(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_TIMEOUT)
+
+
+def _verify(raw_password, encoded):
+    if not encoded:
+        # Hash anyway so unknown emails take as long as wrong passwords
+        make_password(raw_password)
+        return False, None
+    upgraded = []
+    valid = check_password(raw_password, encoded, setter=lambda raw: upgraded.append(make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+def hash_password(raw_password):
+    """Hash a password with the preferred hasher under the hashing limiter."""
+    return hashing_limiter.run(make_password, raw_password)
+
+
+def verify_password(raw_password, encoded):
+    """
+    Check a password against a stored hash under the hashing limiter.
+
+    Returns (valid, new_hash). new_hash is set when the password was
+    valid but stored with an outdated hasher or iteration count; the
+    caller should save it. Pass encoded=None for an unknown user.
+    """
+    return hashing_limiter.run(_verify, raw_password, encoded)
@@ -1,15 +1,29 @@
+import hashlib
+import uuid
 import jwt
 from datetime import datetime, timedelta, timezone
 from django.conf import settings
+from .models import User
+from .redis_utils import get_token_epoch, get_user_version, guarded
 
 
 def generate_token(user):
+    """
+    Issue a token for the user.
+
+    The epoch and version claims come from Redis through the circuit
+    breaker. While Redis is unavailable the "open" policy issues the token
+    with epoch 0 and no version (so the user row is always loaded for it),
+    and the "closed" policy raises AuthBackendUnavailable.
+    """
     payload = {
         'user_id': user.id,
-        'email': user.email,
-        'user_type': user.user_type,
+        **{claim: getattr(user, claim) for claim in settings.JWT_USER_CLAIMS},
         'exp': datetime.now(timezone.utc) + timedelta(days=1),
         'iat': datetime.now(timezone.utc),
+        'jti': uuid.uuid4().hex,
+        'epoch': guarded(0, get_token_epoch, user.id),
+        'ver': guarded(None, get_user_version, user.id),
     }
     return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
 
@@ -22,3 +36,21 @@ def decode_token(token):
         return None
     except jwt.InvalidTokenError:
         return None
+
+
+def get_token_id(token, payload):
+    """Return the token's jti, or a digest of the token for tokens issued without one."""
+    return payload.get('jti') or hashlib.sha256(token.encode()).hexdigest()
+
+
+def user_from_claims(payload):
+    """
+    Build the token's User from its claims without querying the database.
+
+    Fields outside JWT_USER_CLAIMS are deferred, so the row is only loaded
+    if something reads one of them.
+    """
+    claims = {'id': payload['user_id']}
+    claims.update((claim, payload[claim]) for claim in settings.JWT_USER_CLAIMS if claim in payload)
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in claims]
+    return User.from_db(None, fields, [claims[field] for field in fields])
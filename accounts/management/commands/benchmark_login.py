@@ -0,0 +1,86 @@
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from accounts import hashing
+from accounts.jwt_utils import generate_token
+from accounts.models import User
+from benchmarks.workload import latency_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure login and read latency under mixed traffic, with password hashing '
+        'capped by the hashing limiter and, for comparison, uncapped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--reads', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+
+    def handle(self, *args, **options):
+        password = uuid.uuid4().hex
+        user = User.objects.create_user(
+            email=f'bench-{uuid.uuid4().hex}@example.com',
+            password=None,
+            first_name='Bench',
+            last_name='User',
+            dob=date(2000, 1, 1),
+            user_type='viewer',
+        )
+        User.objects.filter(pk=user.pk).update(password=make_password(password))
+        token = generate_token(user)
+        login_body = json.dumps({'email': user.email, 'password': password})
+
+        def fire(kind):
+            client = Client()
+            start = time.perf_counter()
+            try:
+                if kind == 'login':
+                    response = client.post('/auth/login/', login_body, content_type='application/json')
+                else:
+                    response = client.get('/posts/?limit=20', headers={'Authorization': f'Bearer {token}'})
+                return kind, response.status_code, time.perf_counter() - start
+            finally:
+                connection.close()
+
+        def run(limiter):
+            hashing.hashing_limiter = limiter
+            tasks = ['login'] * options['logins'] + ['read'] * options['reads']
+            random.shuffle(tasks)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(fire, tasks))
+            elapsed = time.perf_counter() - start
+            return {
+                'max_concurrent_hashes': limiter.max_concurrent,
+                'seconds': round(elapsed, 3),
+                'login': latency_summary([t for kind, status, t in results if kind == 'login' and status == 200]),
+                'read': latency_summary([t for kind, status, t in results if kind == 'read' and status == 200]),
+                'rejected_503': sum(1 for _, status, _ in results if status == 503),
+                'rate_limited_429': sum(1 for _, status, _ in results if status == 429),
+                'other_errors': sum(1 for _, status, _ in results if status not in (200, 429, 503)),
+            }
+
+        bounded = hashing.hashing_limiter
+        unbounded = hashing.HashingLimiter(options['concurrency'], None)
+        try:
+            # Every request comes from one client address, so the rate limiter
+            # would otherwise answer most of them with 429
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], RATE_LIMIT_ENABLED=False):
+                for limiter in (bounded, unbounded):
+                    result = run(limiter)
+                    self.stdout.write(json.dumps(result))
+                    if result['rate_limited_429']:
+                        raise CommandError('Requests were rate limited, so the latencies do not measure login and reads')
+        finally:
+            hashing.hashing_limiter = bounded
+            user.delete()
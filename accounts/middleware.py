@@ -1,47 +1,235 @@
-from django.http import JsonResponse
-from .jwt_utils import decode_token
+import hashlib
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from myproject.metrics import timed
+from myproject.responses import JsonResponse
+from .cache import TTLCache
+from .jwt_utils import decode_token, get_token_id, user_from_claims
 from .models import User
-from .redis_utils import is_token_blacklisted
+from .redis_utils import (
+    AuthBackendUnavailable,
+    aget_cached_token_epoch,
+    aget_cached_user_version,
+    ais_token_blacklisted,
+    get_cached_token_epoch,
+    get_cached_user_version,
+    is_token_blacklisted,
+)
 
+# Per-process caches so steady-state requests skip the HMAC check and the
+# user lookup. Entries never outlive the token's own `exp`; users are
+# cached as (version, field values) and only reused at the same version.
+token_cache = TTLCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+user_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
 
-class JWTAuthenticationMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+
+
+def get_token_payload(token):
+    """Decode a token, reusing a previously verified payload when possible."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = decode_token(token)
+        if payload:
+            token_cache.set(key, payload, ttl=payload['exp'] - time.time())
+    return payload
+
+
+def _cached_user(user_id, version):
+    cached = user_cache.get(user_id)
+    if version is not None and cached is not None and cached[0] == version:
+        # A new instance per request, so attributes set on it or relations
+        # cached by one request never show up in another
+        return User.from_db(None, USER_FIELDS, cached[1])
+    return None
+
+
+def _cache_user(user, version):
+    if version is not None:
+        user_cache.set(user.id, (version, tuple(getattr(user, field) for field in USER_FIELDS)))
 
-    def __call__(self, request):
-        # Paths that don't require authentication (prefix match)
-        public_prefixes = [
-            '/auth/',
-            '/admin/',
-        ]
 
-        # Exact match paths
-        public_exact = ['/']
+def get_user(payload):
+    """
+    Return the token's user, querying the database only when its claims may be stale.
 
-        # Check if path is public
-        if request.path in public_exact or any(request.path.startswith(prefix) for prefix in public_prefixes):
-            return self.get_response(request)
+    While the token's `ver` claim matches the user's current version the
+    user is built from the claims alone. Otherwise the row is loaded, or
+    reused from the user cache if it was cached at the current version.
+    Without Redis the version is unknown and the row is always loaded.
+    """
+    user_id = payload['user_id']
+    version = get_cached_user_version(user_id)
+    if version is not None and payload.get('ver') == version:
+        return user_from_claims(payload)
+    user = _cached_user(user_id, version)
+    if user is None:
+        user = User.objects.get(id=user_id)
+        _cache_user(user, version)
+    return user
 
-        # Get token from Authorization header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return JsonResponse({'error': 'Authorization header required'}, status=401)
 
-        token = auth_header.split(' ')[1]
+async def aget_user(payload):
+    """Async version of get_user."""
+    user_id = payload['user_id']
+    version = await aget_cached_user_version(user_id)
+    if version is not None and payload.get('ver') == version:
+        return user_from_claims(payload)
+    user = _cached_user(user_id, version)
+    if user is None:
+        user = await User.objects.aget(id=user_id)
+        _cache_user(user, version)
+    return user
 
+
+def bearer_token(request):
+    """Return (token, None) from the Authorization header, or (None, response) rejecting the request."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None, JsonResponse({'error': 'Authorization header required'}, status=401)
+    return auth_header.split(' ')[1], None
+
+
+def authenticate_token(token):
+    """
+    Run every check a token must pass before it is accepted.
+
+    Returns (payload, user, None) for a valid token of an active user, or
+    (None, None, response) with the response that rejects it. Views on
+    public paths that act on the caller's token use this too, so a
+    revoked token or a disabled user is refused there as well.
+    """
+    payload = get_token_payload(token)
+    if not payload:
+        return None, None, JsonResponse({'error': 'Invalid or expired token'}, status=401)
+
+    try:
         # Check if token is blacklisted
-        if is_token_blacklisted(token):
-            return JsonResponse({'error': 'Token has been revoked'}, status=401)
+        if is_token_blacklisted(get_token_id(token, payload)):
+            return None, None, JsonResponse({'error': 'Token has been revoked'}, status=401)
 
-        payload = decode_token(token)
+        # Tokens issued before the user's last "revoke all sessions" are dead
+        if payload.get('epoch', 0) < get_cached_token_epoch(payload['user_id']):
+            return None, None, JsonResponse({'error': 'Token has been revoked'}, status=401)
+    except AuthBackendUnavailable:
+        return None, None, JsonResponse({'error': 'Authentication service unavailable'}, status=503)
+
+    try:
+        user = get_user(payload)
+    except User.DoesNotExist:
+        return None, None, JsonResponse({'error': 'User not found'}, status=401)
+
+    if not user.is_active:
+        return None, None, JsonResponse({'error': 'User account is disabled'}, status=401)
+    return payload, user, None
+
+
+async def aauthenticate_token(token):
+    """Async version of authenticate_token."""
+    payload = get_token_payload(token)
+    if not payload:
+        return None, None, JsonResponse({'error': 'Invalid or expired token'}, status=401)
 
-        if not payload:
-            return JsonResponse({'error': 'Invalid or expired token'}, status=401)
+    try:
+        if await ais_token_blacklisted(get_token_id(token, payload)):
+            return None, None, JsonResponse({'error': 'Token has been revoked'}, status=401)
 
-        try:
-            user = User.objects.get(id=payload['user_id'])
-            request.user = user
-        except User.DoesNotExist:
-            return JsonResponse({'error': 'User not found'}, status=401)
+        if payload.get('epoch', 0) < await aget_cached_token_epoch(payload['user_id']):
+            return None, None, JsonResponse({'error': 'Token has been revoked'}, status=401)
+    except AuthBackendUnavailable:
+        return None, None, JsonResponse({'error': 'Authentication service unavailable'}, status=503)
 
+    try:
+        user = await aget_user(payload)
+    except User.DoesNotExist:
+        return None, None, JsonResponse({'error': 'User not found'}, status=401)
+
+    if not user.is_active:
+        return None, None, JsonResponse({'error': 'User account is disabled'}, status=401)
+    return payload, user, None
+
+
+def cache_stats():
+    """Hit/miss counters for the authentication caches."""
+    return {'token': token_cache.stats(), 'user': user_cache.stats()}
+
+
+# Paths that don't require authentication (prefix match)
+PUBLIC_PREFIXES = (
+    '/auth/',
+    '/admin/',
+    '/wallet/webhook/',  # verified with the Stripe signature instead
+)
+
+# Exact match paths
+PUBLIC_EXACT = (
+    '/',
+    '/metrics',  # protected by METRICS_TOKEN instead
+)
+
+
+class JWTAuthenticationMiddleware:
+    """
+    Authenticate requests from a Bearer JWT.
+
+    Works under both WSGI and ASGI: when the rest of the stack is async,
+    the Redis checks and the user lookup are awaited instead of running
+    in a worker thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        with timed('auth'):
+            response = self._authenticate(request)
+        if response is not None:
+            return response
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        with timed('auth'):
+            response = await self._aauthenticate(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    @staticmethod
+    def _is_public(request):
+        return request.path in PUBLIC_EXACT or request.path.startswith(PUBLIC_PREFIXES)
+
+    def _authenticate(self, request):
+        """Set request.user from the token, or return the response that rejects the request."""
+        if self._is_public(request):
+            return None
+        token, response = bearer_token(request)
+        if token is None:
+            return response
+        _, user, response = authenticate_token(token)
+        if user is None:
+            return response
+        request.user = user
+        return None
+
+    async def _aauthenticate(self, request):
+        """Async version of _authenticate."""
+        if self._is_public(request):
+            return None
+        token, response = bearer_token(request)
+        if token is None:
+            return response
+        _, user, response = await aauthenticate_token(token)
+        if user is None:
+            return response
+        request.user = user
+        return None
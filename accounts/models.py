@@ -3,12 +3,16 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 
 
 class UserManager(BaseUserManager):
-    def create_user(self, email, password=None, **extra_fields):
+    def create_user(self, email, password=None, hashed_password=None, **extra_fields):
+        """Create a user from a raw password, or from an already computed hash."""
         if not email:
             raise ValueError('Email is required')
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        if hashed_password is not None:
+            user.password = hashed_password
+        else:
+            user.set_password(password)
         user.save(using=self._db)
         return user
 
@@ -38,5 +42,20 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'dob', 'user_type']
 
+    class Meta:
+        indexes = [
+            # Admin prefix search by name
+            models.Index(fields=['first_name'], name='user_first_name_idx'),
+            models.Index(fields=['last_name'], name='user_last_name_idx'),
+        ]
+
     def __str__(self):
         return self.email
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Reading one deferred field loads all of them, so a user built from
+        # token claims costs at most one query however many fields a view reads
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using, fields, from_queryset)
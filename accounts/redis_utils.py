@@ -1,23 +1,431 @@
+import asyncio
+import threading
+import time
+import weakref
 import redis
+import redis.asyncio
+import redis.asyncio.client
+import redis.asyncio.retry
+import redis.client
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 from django.conf import settings
+from myproject.metrics import record_redis
+from .bloom import BloomFilter
+from .cache import TTLCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 
-redis_client = redis.Redis(
+
+class AuthBackendUnavailable(Exception):
+    """Redis could not answer an authentication check under the fail-closed policy."""
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Blocking connection pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().get_connection(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_seconds_total += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+    def stats(self):
+        with self._wait_lock:
+            return {
+                'max_connections': self.max_connections,
+                'wait_count': self.wait_count,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            record_redis(time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that adds each command's round trip to the current request's metrics."""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class AsyncInstrumentedPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record_redis(time.perf_counter() - start)
+
+
+class AsyncInstrumentedRedis(redis.asyncio.Redis):
+    """Async version of InstrumentedRedis."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis(time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return AsyncInstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Connection errors and timeouts are retried REDIS_RETRIES times with a
+# short backoff. The retry policy belongs to the pool's connections: a
+# client built on an existing pool ignores its own `retry` argument.
+RETRY_ON_ERROR = [redis.ConnectionError, redis.TimeoutError]
+
+
+def _backoff():
+    return ExponentialBackoff(cap=0.1, base=0.01)
+
+
+connection_pool = InstrumentedConnectionPool(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+    retry=Retry(_backoff(), settings.REDIS_RETRIES),
+    retry_on_error=RETRY_ON_ERROR,
     decode_responses=True
 )
 
+redis_client = InstrumentedRedis(connection_pool=connection_pool)
+
+# redis.asyncio connections belong to the event loop that opened them, so
+# each loop (normally just the ASGI server's) gets its own client.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """Return the asyncio Redis client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncInstrumentedRedis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            retry=redis.asyncio.retry.Retry(_backoff(), settings.REDIS_RETRIES),
+            retry_on_error=RETRY_ON_ERROR,
+            decode_responses=True
+        )
+        _async_clients[loop] = client
+    return client
+
+
+_async_scripts = weakref.WeakKeyDictionary()
+
+
+def get_async_script(source):
+    """Return a Lua script registered once on the running event loop's async client."""
+    client = get_async_redis()
+    scripts = _async_scripts.setdefault(client, {})
+    script = scripts.get(source)
+    if script is None:
+        script = scripts[source] = client.register_script(source)
+    return script
+
+
+# Shared by every authentication check so a Redis outage costs one fast
+# failure per request instead of a socket timeout.
+redis_breaker = CircuitBreaker(
+    settings.REDIS_BREAKER_FAILURE_THRESHOLD,
+    settings.REDIS_BREAKER_RESET_TIMEOUT,
+    expected_exceptions=(redis.RedisError,),
+)
+
+
+def guarded(fail_open_value, func, *args):
+    """
+    Run an authentication Redis call through the circuit breaker.
+
+    When Redis is unavailable, return `fail_open_value` under the "open"
+    REDIS_FAILURE_POLICY, or raise AuthBackendUnavailable under "closed".
+    """
+    try:
+        return redis_breaker.call(func, *args)
+    except (CircuitOpenError, redis.RedisError):
+        if settings.REDIS_FAILURE_POLICY == 'open':
+            return fail_open_value
+        raise AuthBackendUnavailable()
+
+
+async def aguarded(fail_open_value, func, *args):
+    """Async version of guarded() for coroutine functions."""
+    try:
+        return await redis_breaker.acall(func, *args)
+    except (CircuitOpenError, redis.RedisError):
+        if settings.REDIS_FAILURE_POLICY == 'open':
+            return fail_open_value
+        raise AuthBackendUnavailable()
+
+
+def guarded_write(func, *args):
+    """
+    Run a revocation through the circuit breaker, failing closed whatever the policy.
+
+    A logout that silently didn't reach Redis would leave the token
+    usable, so this raises AuthBackendUnavailable when Redis is unavailable.
+    """
+    try:
+        return redis_breaker.call(func, *args)
+    except (CircuitOpenError, redis.RedisError):
+        raise AuthBackendUnavailable()
+
+
+def redis_stats():
+    """Connection pool wait times and circuit breaker state."""
+    return {'pool': connection_pool.stats(), 'breaker': redis_breaker.stats()}
+
 BLACKLIST_PREFIX = 'token_blacklist:'
+# Sorted set of revoked jti -> revocation time, used to sync local filters.
+BLACKLIST_INDEX_KEY = 'token_blacklist_index'
+EPOCH_PREFIX = 'token_epoch:'
+# Allowance for clock skew between the workers writing revocation times.
+SYNC_SKEW = 5
+
+
+class RevokedTokenFilter:
+    """
+    In-process Bloom filter of revoked token ids, synced from Redis.
+
+    A negative answer means the token was not revoked as of the last sync,
+    so the common case never touches Redis. Revocations made by other
+    processes become visible within BLACKLIST_FILTER_SYNC_INTERVAL seconds.
+    Negative answers can only be trusted while the filter is current; see
+    is_current().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._succeeded_at = None
+
+    def _reset(self):
+        self._bloom = BloomFilter(settings.BLACKLIST_FILTER_CAPACITY, settings.BLACKLIST_FILTER_ERROR_RATE)
+        self._watermark = 0.0
+        self._synced_at = 0.0
+        self._built_at = time.monotonic()
+
+    def add(self, jti):
+        with self._lock:
+            self._bloom.add(jti)
+
+    def __contains__(self, jti):
+        return jti in self._bloom
+
+    def is_current(self):
+        """True if the last sync succeeded within BLACKLIST_FILTER_SYNC_INTERVAL seconds."""
+        succeeded_at = self._succeeded_at
+        if succeeded_at is None:
+            return False
+        return time.monotonic() - succeeded_at <= settings.BLACKLIST_FILTER_SYNC_INTERVAL
+
+    def _claim_sync(self):
+        """Reserve the next sync if one is due; returns (rebuild, since) or None."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._synced_at < settings.BLACKLIST_FILTER_SYNC_INTERVAL:
+                return None
+            self._synced_at = now
+            # Periodically start over so expired revocations stop producing false positives.
+            rebuild = self._bloom.saturated or now - self._built_at >= settings.BLACKLIST_FILTER_REBUILD_INTERVAL
+            return rebuild, 0 if rebuild else max(0, self._watermark - SYNC_SKEW)
+
+    def _apply_sync(self, rebuild, entries):
+        with self._lock:
+            self._succeeded_at = self._synced_at
+            if rebuild:
+                synced_at = self._synced_at
+                self._reset()
+                self._synced_at = synced_at
+            for jti, revoked_at in entries:
+                self._bloom.add(jti)
+                self._watermark = max(self._watermark, revoked_at)
+
+    def sync(self):
+        """Pull revocations recorded since the last sync, rebuilding the filter when it goes stale."""
+        claim = self._claim_sync()
+        if claim is None:
+            return
+        rebuild, since = claim
+        try:
+            entries = redis_breaker.call(
+                redis_client.zrangebyscore, BLACKLIST_INDEX_KEY, since, '+inf', withscores=True
+            )
+        except (CircuitOpenError, redis.RedisError):
+            # Hits are still answered from what has been synced so far;
+            # misses go to Redis until a sync succeeds again.
+            return
+        self._apply_sync(rebuild, entries)
+
+    async def async_sync(self):
+        """Async version of sync()."""
+        claim = self._claim_sync()
+        if claim is None:
+            return
+        rebuild, since = claim
+        try:
+            entries = await redis_breaker.acall(
+                get_async_redis().zrangebyscore, BLACKLIST_INDEX_KEY, since, '+inf', withscores=True
+            )
+        except (CircuitOpenError, redis.RedisError):
+            return
+        self._apply_sync(rebuild, entries)
+
+
+revoked_filter = RevokedTokenFilter()
+
+
+def blacklist_token(jti, expires_at):
+    """Revoke a token by its jti until the moment it would have expired anyway."""
+    now = time.time()
+    ttl = max(1, int(expires_at - now))
+    pipe = redis_client.pipeline()
+    pipe.setex(f"{BLACKLIST_PREFIX}{jti}", ttl, "1")
+    pipe.zadd(BLACKLIST_INDEX_KEY, {jti: now})
+    # Index entries older than any token lifetime can no longer matter.
+    pipe.zremrangebyscore(BLACKLIST_INDEX_KEY, 0, now - settings.TOKEN_BLACKLIST_TTL)
+    pipe.execute()
+    revoked_filter.add(jti)
+
+
+def is_token_blacklisted(jti):
+    """
+    Check if a token is blacklisted, answering the common "not revoked" case locally.
+
+    A filter miss is only trusted while the filter is current. Otherwise,
+    and for every filter hit, Redis is asked under REDIS_FAILURE_POLICY.
+    """
+    revoked_filter.sync()
+    if jti not in revoked_filter and revoked_filter.is_current():
+        return False
+    return bool(guarded(False, redis_client.exists, f"{BLACKLIST_PREFIX}{jti}"))
+
+
+async def ais_token_blacklisted(jti):
+    """Async version of is_token_blacklisted."""
+    await revoked_filter.async_sync()
+    if jti not in revoked_filter and revoked_filter.is_current():
+        return False
+    return bool(await aguarded(False, get_async_redis().exists, f"{BLACKLIST_PREFIX}{jti}"))
+
+
+# Per-process copy of each user's token epoch; a bump made on another
+# worker is seen here within AUTH_EPOCH_CACHE_TTL seconds.
+epoch_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_EPOCH_CACHE_TTL)
+
+
+def get_token_epoch(user_id):
+    """Return the user's current token epoch straight from Redis."""
+    return int(redis_client.get(f"{EPOCH_PREFIX}{user_id}") or 0)
+
+
+def get_cached_token_epoch(user_id):
+    """Return the user's token epoch, served from the local cache when fresh."""
+    epoch = epoch_cache.get(user_id)
+    if epoch is None:
+        epoch = guarded(None, get_token_epoch, user_id)
+        if epoch is None:
+            return 0
+        epoch_cache.set(user_id, epoch)
+    return epoch
+
+
+async def aget_cached_token_epoch(user_id):
+    """Async version of get_cached_token_epoch."""
+    epoch = epoch_cache.get(user_id)
+    if epoch is None:
+        epoch = await aguarded(None, get_async_redis().get, f"{EPOCH_PREFIX}{user_id}")
+        if epoch is None:
+            return 0
+        epoch = int(epoch)
+        epoch_cache.set(user_id, epoch)
+    return epoch
+
+
+def revoke_user_tokens(user_id):
+    """Invalidate every token issued to a user so far with a single increment."""
+    epoch = redis_client.incr(f"{EPOCH_PREFIX}{user_id}")
+    epoch_cache.set(user_id, epoch)
+    return epoch
+
+
+VERSION_PREFIX = 'user_version:'
+
+# Per-process copy of each user's version; a bump made on another worker
+# is seen here within AUTH_EPOCH_CACHE_TTL seconds.
+version_cache = TTLCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_EPOCH_CACHE_TTL)
+
+
+def get_user_version(user_id):
+    """Return the version of the user's claims straight from Redis."""
+    return int(redis_client.get(f"{VERSION_PREFIX}{user_id}") or 0)
+
+
+def get_cached_user_version(user_id):
+    """Return the user's version from the local cache when fresh, or None if Redis can't be reached."""
+    version = version_cache.get(user_id)
+    if version is None:
+        try:
+            version = redis_breaker.call(get_user_version, user_id)
+        except (CircuitOpenError, redis.RedisError):
+            return None
+        version_cache.set(user_id, version)
+    return version
 
 
-def blacklist_token(token):
-    """Add a token to the blacklist with TTL of 2 days."""
-    key = f"{BLACKLIST_PREFIX}{token}"
-    redis_client.setex(key, settings.TOKEN_BLACKLIST_TTL, "1")
+async def aget_cached_user_version(user_id):
+    """Async version of get_cached_user_version."""
+    version = version_cache.get(user_id)
+    if version is None:
+        try:
+            version = await redis_breaker.acall(get_async_redis().get, f"{VERSION_PREFIX}{user_id}")
+        except (CircuitOpenError, redis.RedisError):
+            return None
+        version = int(version or 0)
+        version_cache.set(user_id, version)
+    return version
 
 
-def is_token_blacklisted(token):
-    """Check if a token is blacklisted."""
-    key = f"{BLACKLIST_PREFIX}{token}"
-    return redis_client.exists(key)
+def bump_user_version(user_id):
+    """Mark the claims in every token issued to a user so far as stale."""
+    version = redis_client.incr(f"{VERSION_PREFIX}{user_id}")
+    version_cache.set(user_id, version)
+    return version
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import User
+from .redis_utils import bump_user_version
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    """Drop a changed user from this process's authentication cache."""
+    from .middleware import user_cache
+    user_cache.delete(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def bump_version_on_change(sender, instance, created, update_fields=None, **kwargs):
+    """Send tokens carrying a user's old claims or active flag back to the database."""
+    # QuerySet.update() and bulk_update() send no post_save, so code that
+    # changes these fields in bulk must call bump_user_version() itself
+    if created:
+        return
+    watched = {'is_active', *settings.JWT_USER_CLAIMS}
+    if update_fields is not None and not watched.intersection(update_fields):
+        return
+    # After commit, so a request can't load the old row under the new version
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_user_version(user_id))
+
+
+@receiver(post_delete, sender=User)
+def bump_version_on_delete(sender, instance, **kwargs):
+    """Tokens of a deleted user must stop resolving from their claims."""
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_user_version(user_id))
@@ -1,3 +1,488 @@
-from django.test import TestCase
+import json
+import threading
+import time
+import uuid
+from datetime import date
+from unittest import skipUnless
+from unittest.mock import patch
+import redis
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from myproject.middleware import LoadSheddingMiddleware
+from myproject.ratelimit import KEY_PREFIX, SLIDING_WINDOW_LUA, InFlightLimiter
+from myproject.responses import JsonResponse
+from .bloom import BloomFilter
+from .checks import check_jwt_user_claims
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .hashing import HashingLimiter, HashingUnavailable
+from .jwt_utils import decode_token, generate_token
+from .middleware import JWTAuthenticationMiddleware, token_cache, user_cache
+from .models import User
+from .redis_utils import (
+    AuthBackendUnavailable,
+    BLACKLIST_INDEX_KEY,
+    BLACKLIST_PREFIX,
+    EPOCH_PREFIX,
+    InstrumentedConnectionPool,
+    InstrumentedRedis,
+    RevokedTokenFilter,
+    blacklist_token,
+    connection_pool,
+    epoch_cache,
+    get_async_script,
+    is_token_blacklisted,
+    redis_client,
+    version_cache,
+)
 
-# Create your tests here.
+
+def down_redis():
+    """A client for a port nothing listens on."""
+    return InstrumentedRedis(host='127.0.0.1', port=1, socket_connect_timeout=0.1, decode_responses=True)
+
+
+class ClaimsUserTests(TestCase):
+    """Authenticated requests resolve the user from token claims until the user changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='claims@example.com',
+            password=None,
+            first_name='Claire',
+            last_name='Claims',
+            dob=date(1990, 1, 1),
+            user_type='editor',
+        )
+
+    def setUp(self):
+        for cache in (token_cache, user_cache, epoch_cache, version_cache):
+            cache.clear()
+        self.token = generate_token(self.user)
+        self.seen = []
+        self.middleware = JWTAuthenticationMiddleware(self.view)
+
+    def view(self, request):
+        self.seen.append(request.user)
+        return JsonResponse({'id': request.user.id, 'email': request.user.email})
+
+    def call(self):
+        request = RequestFactory().get('/posts/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        return self.middleware(request)
+
+    def test_claims_need_no_query(self):
+        self.call()
+        with self.assertNumQueries(0):
+            response = self.call()
+        self.assertEqual(response.status_code, 200)
+        user = self.seen[-1]
+        self.assertIsInstance(user, User)
+        self.assertEqual((user.pk, user.email, user.user_type), (self.user.pk, 'claims@example.com', 'editor'))
+
+    def test_other_fields_load_once(self):
+        self.call()
+        user = self.seen[-1]
+        with self.assertNumQueries(1):
+            self.assertEqual((user.first_name, user.last_name, user.dob), ('Claire', 'Claims', date(1990, 1, 1)))
+
+    def test_changed_user_falls_back_to_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = 'renamed@example.com'
+            self.user.save()
+        with self.assertNumQueries(1):
+            self.call()
+        self.assertEqual(self.seen[-1].email, 'renamed@example.com')
+        # Cached at the new version, so the stale token costs no further queries
+        with self.assertNumQueries(0):
+            self.call()
+
+    def test_cached_row_is_not_shared(self):
+        # A claim changed, so this token's user comes from the cached row
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.email = 'changed@example.com'
+            self.user.save()
+        self.call()
+        self.seen[-1].email = 'leaked@example.com'
+        self.seen[-1]._state.fields_cache['wallet'] = None
+        with self.assertNumQueries(0):
+            self.call()
+        self.assertIsNot(self.seen[-1], self.seen[-2])
+        self.assertEqual(self.seen[-1].email, 'changed@example.com')
+        self.assertEqual(self.seen[-1]._state.fields_cache, {})
+
+    def test_deactivated_user_is_rejected(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.call().status_code, 401)
+        self.assertEqual(self.seen, [])
+
+    def test_deleted_user_is_rejected(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).delete()
+        self.assertEqual(self.call().status_code, 401)
+
+    def test_unrelated_save_keeps_claims_valid(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.save(update_fields=['password'])
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.call()
+
+
+    def test_claims_must_be_json_safe(self):
+        self.assertEqual(check_jwt_user_claims(None), [])
+        with self.settings(JWT_USER_CLAIMS=['email', 'dob', 'created_at', 'nickname']):
+            errors = check_jwt_user_claims(None)
+        self.assertEqual([error.id for error in errors], ['accounts.E002', 'accounts.E002', 'accounts.E001'])
+
+class RevokedTokenTests(TestCase):
+    """Revocations are keyed by jti and answered from the Bloom filter unless it may hold the token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='revoked@example.com', password=None, first_name='Rex', last_name='Voked',
+            dob=date(1990, 1, 1), user_type='viewer',
+        )
+
+    def setUp(self):
+        token_cache.clear()
+        self.middleware = JWTAuthenticationMiddleware(lambda request: JsonResponse({}))
+
+    def call(self, token):
+        return self.middleware(RequestFactory().get('/posts/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        added = [uuid.uuid4().hex for _ in range(1000)]
+        for item in added:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in added))
+        self.assertTrue(bloom.saturated)
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_revoked_jti_rejected(self):
+        token, other = generate_token(self.user), generate_token(self.user)
+        payload = decode_token(token)
+        blacklist_token(payload['jti'], payload['exp'])
+        self.assertTrue(redis_client.exists(f'{BLACKLIST_PREFIX}{payload["jti"]}'))
+        self.assertEqual(self.call(token).status_code, 401)
+        self.assertEqual(self.call(other).status_code, 200)
+
+    @override_settings(BLACKLIST_FILTER_SYNC_INTERVAL=0)
+    def test_sync_picks_up_revocations_from_other_workers(self):
+        revoked = RevokedTokenFilter()
+        jti = uuid.uuid4().hex
+        self.assertNotIn(jti, revoked)
+        redis_client.zadd(BLACKLIST_INDEX_KEY, {jti: time.time()})
+        revoked.sync()
+        self.assertIn(jti, revoked)
+
+    @override_settings(BLACKLIST_FILTER_SYNC_INTERVAL=0, BLACKLIST_FILTER_REBUILD_INTERVAL=0)
+    def test_rebuild_drops_revocations_no_longer_indexed(self):
+        revoked = RevokedTokenFilter()
+        expired, current = uuid.uuid4().hex, uuid.uuid4().hex
+        revoked.add(expired)
+        redis_client.zadd(BLACKLIST_INDEX_KEY, {current: time.time()})
+        revoked.sync()
+        self.assertNotIn(expired, revoked)
+        self.assertIn(current, revoked)
+
+
+class RedisResilienceTests(SimpleTestCase):
+    """The pool retries and bounds waits, and the breaker stops calling a dead Redis."""
+
+    def breaker(self):
+        return CircuitBreaker(2, 0.05, expected_exceptions=(redis.RedisError,))
+
+    def test_breaker_opens_and_recovers(self):
+        breaker = self.breaker()
+        for _ in range(2):
+            with self.assertRaises(redis.ConnectionError):
+                breaker.call(down_redis().ping)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(redis_client.ping)
+        time.sleep(0.06)
+        self.assertTrue(breaker.call(redis_client.ping))
+        self.assertEqual(breaker.stats(), {'state': 'closed', 'failures': 0, 'rejected': 1})
+
+    def test_failed_trial_reopens(self):
+        breaker = self.breaker()
+        for _ in range(2):
+            with self.assertRaises(redis.ConnectionError):
+                breaker.call(down_redis().ping)
+        time.sleep(0.06)
+        with self.assertRaises(redis.ConnectionError):
+            breaker.call(down_redis().ping)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(redis_client.ping)
+
+    def test_unexpected_error_in_trial_frees_the_next_call(self):
+        breaker = self.breaker()
+        for _ in range(2):
+            with self.assertRaises(redis.ConnectionError):
+                breaker.call(down_redis().ping)
+        time.sleep(0.06)
+        with self.assertRaises(ValueError):
+            breaker.call(int, 'not a number')
+        self.assertTrue(breaker.call(redis_client.ping))
+        self.assertEqual(breaker.stats()['state'], 'closed')
+
+    def test_pool_connections_retry(self):
+        connection = connection_pool.get_connection()
+        try:
+            self.assertEqual(connection.retry.get_retries(), settings.REDIS_RETRIES)
+        finally:
+            connection_pool.release(connection)
+        self.assertIsNotNone(redis_client.get_retry())
+
+    def test_pool_wait_is_bounded(self):
+        pool = InstrumentedConnectionPool(
+            host=settings.REDIS_HOST, port=settings.REDIS_PORT, max_connections=1, timeout=0.05
+        )
+        held = pool.get_connection()
+        try:
+            with self.assertRaises(redis.ConnectionError):
+                pool.get_connection()
+        finally:
+            pool.release(held)
+            pool.disconnect()
+        stats = pool.stats()
+        self.assertEqual(stats['wait_count'], 2)
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.05)
+
+
+class FailClosedBlacklistTests(SimpleTestCase):
+    """Without a current filter, a miss is checked in Redis under the failure policy."""
+
+    def setUp(self):
+        self.revoked = RevokedTokenFilter()
+        for target, value in (
+            ('revoked_filter', self.revoked),
+            ('redis_breaker', CircuitBreaker(5, 10, expected_exceptions=(redis.RedisError,))),
+        ):
+            patcher = patch(f'accounts.redis_utils.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def with_redis_down(self):
+        return patch('accounts.redis_utils.redis_client', down_redis())
+
+    @override_settings(REDIS_FAILURE_POLICY='closed')
+    def test_never_synced_filter_fails_closed(self):
+        with self.with_redis_down(), self.assertRaises(AuthBackendUnavailable):
+            is_token_blacklisted(uuid.uuid4().hex)
+
+    @override_settings(REDIS_FAILURE_POLICY='open')
+    def test_never_synced_filter_fails_open(self):
+        with self.with_redis_down():
+            self.assertFalse(is_token_blacklisted(uuid.uuid4().hex))
+
+    @override_settings(REDIS_FAILURE_POLICY='closed')
+    def test_current_filter_answers_misses_locally(self):
+        self.revoked.sync()
+        self.assertTrue(self.revoked.is_current())
+        with self.with_redis_down():
+            self.assertFalse(is_token_blacklisted(uuid.uuid4().hex))
+
+    @override_settings(REDIS_FAILURE_POLICY='closed', BLACKLIST_FILTER_SYNC_INTERVAL=0.05)
+    def test_failed_sync_fails_closed(self):
+        self.revoked.sync()
+        time.sleep(0.06)
+        with self.with_redis_down():
+            self.revoked.sync()
+            self.assertFalse(self.revoked.is_current())
+            with self.assertRaises(AuthBackendUnavailable):
+                is_token_blacklisted(uuid.uuid4().hex)
+
+
+class SessionTests(TestCase):
+    """Logout endpoints apply the middleware's checks to the caller's token."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='sessions@example.com', password=None, first_name='Sam', last_name='Sessions',
+            dob=date(1990, 1, 1), user_type='viewer',
+        )
+
+    def setUp(self):
+        for cache in (token_cache, user_cache, epoch_cache, version_cache):
+            cache.clear()
+        # Ids repeat across test runs but Redis doesn't roll back
+        redis_client.delete(f'{EPOCH_PREFIX}{self.user.id}')
+
+    def post(self, path, token):
+        return self.client.post(path, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_logout_all_revokes_every_token(self):
+        first, second = generate_token(self.user), generate_token(self.user)
+        self.assertEqual(self.post('/auth/logout-all/', first).status_code, 200)
+        self.assertEqual(self.client.get('/posts/', HTTP_AUTHORIZATION=f'Bearer {second}').status_code, 401)
+        # The revoked token can't be used to revoke again or to log out
+        self.assertEqual(self.post('/auth/logout-all/', first).status_code, 401)
+        self.assertEqual(self.post('/auth/logout/', second).status_code, 401)
+        # Tokens issued afterwards work
+        self.assertEqual(self.post('/auth/logout/', generate_token(self.user)).status_code, 200)
+
+    def test_logged_out_token_rejected(self):
+        token = generate_token(self.user)
+        self.assertEqual(self.post('/auth/logout/', token).status_code, 200)
+        self.assertEqual(self.post('/auth/logout-all/', token).status_code, 401)
+
+    def test_disabled_user_rejected(self):
+        token = generate_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.post('/auth/logout-all/', token).status_code, 401)
+
+    def test_token_issued_while_redis_is_down(self):
+        down = redis.ConnectionError('down')
+        with patch('accounts.jwt_utils.get_token_epoch', side_effect=down):
+            token = generate_token(self.user)
+            with override_settings(REDIS_FAILURE_POLICY='closed'), self.assertRaises(AuthBackendUnavailable):
+                generate_token(self.user)
+        payload = decode_token(token)
+        self.assertEqual(payload['epoch'], 0)
+        self.assertEqual(self.post('/auth/logout/', token).status_code, 200)
+
+    def test_logout_fails_closed_when_redis_is_down(self):
+        token = generate_token(self.user)
+        down = redis.ConnectionError('down')
+        # Even under the "open" policy, a revocation that didn't happen is reported
+        with (
+            patch('accounts.redis_utils.redis_breaker', CircuitBreaker(5, 30)),
+            patch('accounts.views.blacklist_token', side_effect=down),
+            patch('accounts.views.revoke_user_tokens', side_effect=down),
+        ):
+            self.assertEqual(self.post('/auth/logout/', token).status_code, 503)
+            self.assertEqual(self.post('/auth/logout-all/', token).status_code, 503)
+        self.assertEqual(self.post('/auth/logout-all/', token).status_code, 200)
+
+
+class RateLimitTests(TestCase):
+    """Routes in RATE_LIMITS answer 429 once a client's sliding window is full."""
+
+    def setUp(self):
+        # The windows live in Redis across runs, so each test counts under its own prefix
+        self.prefix = f'{KEY_PREFIX}test:{uuid.uuid4().hex}:'
+        patcher = patch('myproject.ratelimit.KEY_PREFIX', self.prefix)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        keys = list(redis_client.scan_iter(f'{self.prefix}*'))
+        if keys:
+            redis_client.delete(*keys)
+
+    def login(self, ip):
+        return self.client.post(
+            '/auth/login/', {'email': 'nobody@example.com', 'password': 'x'},
+            content_type='application/json', REMOTE_ADDR=ip,
+        )
+
+    @override_settings(RATE_LIMITS={'login': {'ip': (3, 60)}})
+    def test_login_limited_per_ip(self):
+        self.assertEqual([self.login('10.0.0.1').status_code for _ in range(3)], [401, 401, 401])
+        response = self.login('10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertEqual(self.login('10.0.0.2').status_code, 401)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': (3, 60)}}, RATE_LIMIT_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual({self.login('10.0.0.1').status_code for _ in range(5)}, {401})
+
+    @override_settings(RATE_LIMITS={'login': {'ip': (2, 60)}})
+    async def test_async_stack(self):
+        statuses = []
+        for _ in range(3):
+            response = await self.async_client.post(
+                '/auth/login/', {'email': 'nobody@example.com', 'password': 'x'}, content_type='application/json'
+            )
+            statuses.append(response.status_code)
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertIs(get_async_script(SLIDING_WINDOW_LUA), get_async_script(SLIDING_WINDOW_LUA))
+
+
+class LoadSheddingTests(TestCase):
+    def test_sheds_past_threshold(self):
+        limiter = InFlightLimiter(1)
+        nested = []
+
+        def view(request):
+            # A second request arriving while this one is in flight
+            nested.append(middleware(RequestFactory().get('/posts/')))
+            return JsonResponse({})
+
+        middleware = LoadSheddingMiddleware(view)
+        with patch('myproject.middleware.in_flight_limiter', limiter):
+            self.assertEqual(middleware(RequestFactory().get('/posts/')).status_code, 200)
+        self.assertEqual(nested[0].status_code, 503)
+        self.assertEqual(nested[0]['Retry-After'], '1')
+        self.assertEqual(limiter.stats(), {'max_in_flight': 1, 'in_flight': 0, 'shed': 1})
+
+
+class PasswordHashingTests(TestCase):
+    def test_limiter_runs_on_calling_thread(self):
+        limiter = HashingLimiter(1, 0)
+        self.assertIs(limiter.run(threading.current_thread), threading.current_thread())
+
+        def saturated():
+            # The only slot is held, so a second hash is rejected at once
+            with self.assertRaises(HashingUnavailable):
+                limiter.run(lambda: None)
+
+        limiter.run(saturated)
+        self.assertEqual(limiter.stats(), {'in_flight': 0, 'completed': 2, 'rejected': 1})
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_register_normalizes_email(self):
+        response = self.client.post('/auth/register/', json.dumps({
+            'email': 'Hash.Check@EXAMPLE.COM', 'password': 'correct horse', 'first_name': 'Hal',
+            'last_name': 'Ash', 'dob': '1990-01-01', 'user_type': 'viewer',
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(id=response.json()['user']['id'])
+        self.assertEqual(user.email, 'Hash.Check@example.com')
+        self.assertTrue(user.check_password('correct horse'))
+
+
+class UserAdminSearchTests(TestCase):
+    """User search matches email, first name or last name by prefix, from indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', first_name='Ada', last_name='Admin', dob=date(1990, 1, 1), user_type='editor'
+        )
+        for i, (first, last) in enumerate([('Grace', 'Hopper'), ('Alan', 'Turing'), ('Alonzo', 'Church')]):
+            User.objects.create_user(
+                email=f'user{i}@example.com', first_name=first, last_name=last, dob=date(1990, 1, 1), user_type='viewer'
+            )
+
+    def search(self, term):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/accounts/user/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_prefix_search(self):
+        self.assertEqual({user.last_name for user in self.search('Al').result_list}, {'Turing', 'Church'})
+        self.assertEqual([user.first_name for user in self.search('Hop').result_list], ['Grace'])
+        self.assertEqual(self.search('user').result_count, 3)
+        # Case-sensitive, and the search box says so
+        changelist = self.search('hopper')
+        self.assertEqual(changelist.result_count, 0)
+        self.assertIn('case-sensitive', changelist.search_help_text)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_search_uses_indexes(self):
+        plan = self.search('Al').queryset.explain()
+        self.assertNotIn('SCAN', plan)
+        for index in ('user_first_name_idx', 'user_last_name_idx'):
+            self.assertIn(index, plan)
@@ -1,11 +1,23 @@
 import json
 from datetime import datetime
-from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from myproject.responses import JsonResponse
+from .hashing import HashingUnavailable, hash_password, verify_password
+from .middleware import authenticate_token, bearer_token
 from .models import User
-from .jwt_utils import generate_token
-from .redis_utils import blacklist_token
+from .jwt_utils import generate_token, get_token_id
+from .redis_utils import AuthBackendUnavailable, blacklist_token, guarded_write, revoke_user_tokens
+
+
+def auth_unavailable():
+    return JsonResponse({'error': 'Authentication service unavailable'}, status=503)
+
+
+def hashing_busy():
+    response = JsonResponse({'error': 'Server busy, please retry'}, status=503)
+    response['Retry-After'] = '1'
+    return response
 
 
 @csrf_exempt
@@ -30,16 +42,24 @@ def register(request):
         except ValueError:
             return JsonResponse({'error': 'dob must be in YYYY-MM-DD format'}, status=400)
 
+        try:
+            password = hash_password(data['password'])
+        except HashingUnavailable:
+            return hashing_busy()
+
         user = User.objects.create_user(
             email=data['email'],
-            password=data['password'],
+            hashed_password=password,
             first_name=data['first_name'],
             last_name=data['last_name'],
             dob=dob,
             user_type=data['user_type'],
         )
 
-        token = generate_token(user)
+        try:
+            token = generate_token(user)
+        except AuthBackendUnavailable:
+            return auth_unavailable()
 
         return JsonResponse({
             'message': 'User registered successfully',
@@ -68,15 +88,24 @@ def login(request):
         if not email or not password:
             return JsonResponse({'error': 'email and password are required'}, status=400)
 
+        user = User.objects.filter(email=email).first()
         try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            return JsonResponse({'error': 'Invalid credentials'}, status=401)
+            valid, new_hash = verify_password(password, user.password if user else None)
+        except HashingUnavailable:
+            return hashing_busy()
 
-        if not user.check_password(password):
+        if not valid:
             return JsonResponse({'error': 'Invalid credentials'}, status=401)
 
-        token = generate_token(user)
+        if new_hash:
+            # Stored with outdated hasher parameters; keep the upgraded hash
+            user.password = new_hash
+            user.save(update_fields=['password'])
+
+        try:
+            token = generate_token(user)
+        except AuthBackendUnavailable:
+            return auth_unavailable()
 
         return JsonResponse({
             'message': 'Login successful',
@@ -96,11 +125,38 @@ def login(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def logout(request):
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return JsonResponse({'error': 'Authorization header required'}, status=401)
+    token, response = bearer_token(request)
+    if token is None:
+        return response
 
-    token = auth_header.split(' ')[1]
-    blacklist_token(token)
+    # /auth/ is public, so run the middleware's checks here
+    payload, _, response = authenticate_token(token)
+    if payload is None:
+        return response
+
+    try:
+        guarded_write(blacklist_token, get_token_id(token, payload), payload['exp'])
+    except AuthBackendUnavailable:
+        return auth_unavailable()
 
     return JsonResponse({'message': 'Logged out successfully'})
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def logout_all(request):
+    """Revoke every outstanding token of the calling user."""
+    token, response = bearer_token(request)
+    if token is None:
+        return response
+
+    payload, _, response = authenticate_token(token)
+    if payload is None:
+        return response
+
+    try:
+        guarded_write(revoke_user_tokens, payload['user_id'])
+    except AuthBackendUnavailable:
+        return auth_unavailable()
+
+    return JsonResponse({'message': 'All sessions revoked'})
@@ -0,0 +1,77 @@
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from accounts.models import User
+from myproject import responses
+from posts.models import Post
+from posts.views import post_to_dict
+
+
+def legacy_post_to_dict(post):
+    """post_to_dict as it was before the shared serializer: datetimes formatted by hand."""
+    return {
+        **post_to_dict(post),
+        'created_at': post.created_at.isoformat(),
+        'updated_at': post.updated_at.isoformat(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Time rendering a page of posts to JSON with the old stdlib path, the shared '
+        'serializer on the stdlib encoder, and the shared serializer on orjson.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Unsaved instances: this measures serialization only, not the database
+        now = timezone.now()
+        authors = [
+            User(id=i, email=f'author{i}@example.com', first_name='Bench', last_name=f'Author {i}',
+                 dob=date(1990, 1, 1), user_type='editor')
+            for i in range(20)
+        ]
+        posts = [
+            Post(id=i, title=f'Post {i}', description='Lorem ipsum dolor sit amet ' * 8, rating=i % 5 + 1,
+                 author=authors[i % 20], created_at=now - timedelta(seconds=i), updated_at=now)
+            for i in range(options['posts'])
+        ]
+
+        encoders = {
+            'stdlib_legacy': lambda: json.dumps(
+                {'posts': [legacy_post_to_dict(post) for post in posts]}, cls=DjangoJSONEncoder
+            ).encode(),
+            'stdlib': lambda: responses._stdlib_encoder.encode(
+                {'posts': [post_to_dict(post) for post in posts]}
+            ).encode(),
+        }
+        if responses.orjson is not None:
+            encoders['orjson'] = lambda: responses.dumps({'posts': [post_to_dict(post) for post in posts]})
+
+        results = {}
+        for name, encode in encoders.items():
+            encode()  # warm up
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                body = encode()
+                timings.append(time.perf_counter() - start)
+            results[name] = {
+                'median_ms': round(statistics.median(timings) * 1000, 2),
+                'min_ms': round(min(timings) * 1000, 2),
+                'bytes': len(body),
+            }
+
+        self.stdout.write(json.dumps({
+            'posts': options['posts'],
+            'repeat': options['repeat'],
+            'active_encoder': 'orjson' if responses.orjson is not None else 'stdlib',
+            'results': results,
+        }, indent=2))
@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from benchmarks import workload
+from posts.cache import bump_generation
+
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:
+    TcpFakeServer = None
+
+WEBHOOK_SECRET = 'whsec_benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a mixed workload (login, post reads and writes, wallet, Stripe webhooks) '
+        'against the WSGI and ASGI app on a throwaway database, and print per-scenario '
+        'req/s and p50/p95/p99 as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--mix', default=workload.DEFAULT_MIX,
+                            help=f'Scenario weights, e.g. "{workload.DEFAULT_MIX}".')
+        parser.add_argument('--servers', default='wsgi,asgi', help='Comma-separated: wsgi, asgi.')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--real-redis', action='store_true',
+                            help='Use the configured Redis instead of an in-process fakeredis server.')
+        parser.add_argument('--output', help='Also write the JSON report to this file.')
+        # Internal: run one server mode in a child process
+        parser.add_argument('--worker', choices=('wsgi', 'asgi'), help='Internal: run a single server mode.')
+
+    def handle(self, *args, **options):
+        try:
+            weights = workload.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_worker(options['worker'], weights, options)))
+            return
+
+        servers = [server for server in options['servers'].split(',') if server]
+        if not set(servers) <= {'wsgi', 'asgi'}:
+            raise CommandError('--servers accepts wsgi and asgi')
+
+        # Every simulated client shares one address, so per-IP limits would throttle the run
+        env = {**os.environ, 'STRIPE_WEBHOOK_SECRET': WEBHOOK_SECRET, 'RATE_LIMIT_ENABLED': 'False'}
+        fake_server = None
+        if not options['real_redis']:
+            if TcpFakeServer is None:
+                raise CommandError('fakeredis is not installed; pip install fakeredis or pass --real-redis')
+            fake_server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+            threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+            env.update(REDIS_HOST='127.0.0.1', REDIS_PORT=str(fake_server.server_address[1]), REDIS_DB='0')
+
+        try:
+            report = {
+                'commit': self.git_commit(),
+                'config': {key: options[key] for key in ('requests', 'concurrency', 'mix', 'users', 'posts')},
+                'redis': 'real' if options['real_redis'] else 'fakeredis',
+                'results': [self.spawn(server, env, options) for server in servers],
+            }
+        finally:
+            if fake_server is not None:
+                fake_server.shutdown()
+                fake_server.server_close()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def spawn(self, server, env, options):
+        """Run one server mode in a fresh process so settings and the URLconf match it."""
+        env = {**env, 'ASYNC_VIEWS': 'True' if server == 'asgi' else 'False'}
+        argv = [sys.executable, '-m', 'django', 'run_benchmarks', '--worker', server]
+        for key in ('requests', 'concurrency', 'mix', 'users', 'posts'):
+            argv += [f'--{key}', str(options[key])]
+        proc = subprocess.run(argv, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise CommandError(f'{server} run failed:\n{proc.stderr}')
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    def run_worker(self, server, weights, options):
+        """Seed a fresh test database, run the workload and tear the database down."""
+        db_dir = tempfile.mkdtemp(prefix='benchmarks-')
+        # A file rather than SQLite's shared in-memory database, so writer threads
+        # wait on locks instead of failing
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}),
+                                            'NAME': os.path.join(db_dir, 'benchmark.sqlite3')}
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            data = workload.seed(options['users'], options['posts'])
+            # Cached post responses from earlier runs refer to another database
+            bump_generation()
+            names = workload.schedule(weights, options['requests'])
+            run = workload.run_wsgi if server == 'wsgi' else workload.run_asgi
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), workload.stub_stripe():
+                result = run(data, names, options['concurrency'])
+            return {'server': server, **result, 'outbox_drain': workload.drain_outbox()}
+        finally:
+            runner.teardown_databases(old_config)
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import AsyncClient, Client
+from accounts.jwt_utils import generate_token
+from accounts.models import User
+from posts.models import Post
+from posts.ratings import rebuild_aggregates
+from wallet.models import Wallet
+from wallet.outbox import process_batch
+
+PASSWORD = 'benchmark-password'
+DEFAULT_MIX = 'login=1,list_posts=8,get_post=4,create_post=3,balance=3,fund=1,webhook=2'
+
+
+@dataclass
+class Dataset:
+    users: list = field(default_factory=list)  # (id, email, token)
+    post_ids: list = field(default_factory=list)
+
+
+def seed(users=20, posts=2000):
+    """Create users with funded wallets and a posts table to read from."""
+    encoded = make_password(PASSWORD)  # hashed once and shared, seeding stays fast
+    created = User.objects.bulk_create(
+        User(
+            email=f'bench{i}@example.com',
+            password=encoded,
+            first_name='Bench',
+            last_name=f'User {i}',
+            dob=date(1990, 1, 1),
+            user_type='editor',
+        )
+        for i in range(users)
+    )
+    Wallet.objects.bulk_create(Wallet(user=user, balance=Decimal('100000.00')) for user in created)
+    Post.objects.bulk_create(
+        (
+            Post(title=f'Post {i}', description='Benchmark post body ' * 10, rating=i % 5 + 1,
+                 author=created[i % users])
+            for i in range(posts)
+        ),
+        batch_size=1000,
+    )
+    rebuild_aggregates()
+    return Dataset(
+        users=[(user.id, user.email, generate_token(user)) for user in created],
+        post_ids=list(Post.objects.values_list('id', flat=True)),
+    )
+
+
+def signed_webhook(user_id):
+    """Build a payment_intent.succeeded event signed with STRIPE_WEBHOOK_SECRET."""
+    intent_id = f'pi_bench_{uuid.uuid4().hex}'
+    payload = json.dumps({
+        'id': f'evt_bench_{uuid.uuid4().hex}',
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {'id': intent_id, 'object': 'payment_intent', 'amount': 1000,
+                            'metadata': {'user_id': str(user_id)}}},
+    })
+    timestamp = int(time.time())
+    signature = hmac.new(
+        settings.STRIPE_WEBHOOK_SECRET.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256
+    ).hexdigest()
+    return payload, {'Stripe-Signature': f't={timestamp},v1={signature}'}
+
+
+# Each scenario turns (dataset, rng) into (method, path, body, headers, expected_status)
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def login(data, rng):
+    _, email, _ = rng.choice(data.users)
+    return 'POST', '/auth/login/', json.dumps({'email': email, 'password': PASSWORD}), {}, 200
+
+
+def list_posts(data, rng):
+    return 'GET', '/posts/?limit=20', '', _auth(rng.choice(data.users)[2]), 200
+
+
+def get_post(data, rng):
+    return 'GET', f'/posts/{rng.choice(data.post_ids)}/', '', _auth(rng.choice(data.users)[2]), 200
+
+
+def create_post(data, rng):
+    body = json.dumps({'title': 'Benchmark', 'description': 'Created during a benchmark run', 'rating': 4})
+    return 'POST', '/posts/create/', body, _auth(rng.choice(data.users)[2]), 201
+
+
+def balance(data, rng):
+    return 'GET', '/wallet/balance/', '', _auth(rng.choice(data.users)[2]), 200
+
+
+def fund(data, rng):
+    return 'POST', '/wallet/fund/', json.dumps({'amount': '10.00'}), _auth(rng.choice(data.users)[2]), 200
+
+
+def webhook(data, rng):
+    payload, headers = signed_webhook(rng.choice(data.users)[0])
+    return 'POST', '/wallet/webhook/stripe/', payload, headers, 200
+
+
+SCENARIOS = {
+    'login': login,
+    'list_posts': list_posts,
+    'get_post': get_post,
+    'create_post': create_post,
+    'balance': balance,
+    'fund': fund,
+    'webhook': webhook,
+}
+
+
+def parse_mix(mix):
+    """Parse 'name=weight,...' into {name: weight}."""
+    weights = {}
+    for part in filter(None, mix.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def schedule(weights, total, seed=0):
+    """A reproducible, shuffled list of `total` scenario names in proportion to their weights."""
+    rng = random.Random(seed)
+    return rng.choices(list(weights), weights=list(weights.values()), k=total)
+
+
+def percentile(sorted_latencies, fraction):
+    return round(sorted_latencies[min(len(sorted_latencies) - 1, int(len(sorted_latencies) * fraction))] * 1000, 2)
+
+
+def latency_summary(latencies, elapsed=None):
+    """Request count, p50 and p99 in ms, and req/s when the run's `elapsed` seconds are given."""
+    latencies = sorted(latencies)
+    summary = {'requests': len(latencies)}
+    if elapsed:
+        summary['requests_per_second'] = round(len(latencies) / elapsed, 1)
+    if latencies:
+        summary['p50_ms'] = percentile(latencies, 0.50)
+        summary['p99_ms'] = percentile(latencies, 0.99)
+    return summary
+
+
+def summarize(results, elapsed):
+    """Turn [(scenario, latency, ok)] into overall and per-scenario req/s and percentiles."""
+    def stats(rows):
+        latencies = sorted(latency for _, latency, _ in rows)
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for _, _, ok in rows if not ok),
+            'requests_per_second': round(len(rows) / elapsed, 1),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+        }
+
+    by_scenario = {}
+    for row in results:
+        by_scenario.setdefault(row[0], []).append(row)
+    return {
+        'seconds': round(elapsed, 3),
+        'total': stats(results),
+        'scenarios': {name: stats(rows) for name, rows in sorted(by_scenario.items())},
+    }
+
+
+def stub_stripe():
+    """Answer PaymentIntent.create locally instead of calling the Stripe API."""
+    def create(**kwargs):
+        intent_id = f'pi_bench_{uuid.uuid4().hex}'
+        return SimpleNamespace(id=intent_id, client_secret=f'{intent_id}_secret_bench')
+    return mock.patch('stripe.PaymentIntent.create', side_effect=create)
+
+
+def run_wsgi(data, names, concurrency):
+    """Fire the scheduled requests through the WSGI handler from a thread pool."""
+    def fire(args):
+        i, name = args
+        method, path, body, headers, expected = SCENARIOS[name](data, random.Random(i))
+        start = time.perf_counter()
+        try:
+            response = Client().generic(method, path, body, content_type='application/json', headers=headers)
+            return name, time.perf_counter() - start, response.status_code == expected
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fire, enumerate(names)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def run_asgi(data, names, concurrency):
+    """Fire the scheduled requests through the ASGI handler from one event loop."""
+    async def main():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fire(i, name):
+            method, path, body, headers, expected = SCENARIOS[name](data, random.Random(i))
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.generic(method, path, body, content_type='application/json', headers=headers)
+                return name, time.perf_counter() - start, response.status_code == expected
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(fire(i, name) for i, name in enumerate(names)))
+        return summarize(results, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def drain_outbox(batch_size=100):
+    """Apply every queued webhook event and report how long it took."""
+    start = time.perf_counter()
+    events = 0
+    while True:
+        picked = process_batch(batch_size)
+        if not picked:
+            break
+        events += picked
+    return {'events': events, 'seconds': round(time.perf_counter() - start, 3)}
@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Approximate row count of a model's table from planner statistics.
+
+    Reads sqlite_stat1 on SQLite and pg_class.reltuples on PostgreSQL, so
+    it costs one index lookup instead of a table scan. Returns None when
+    the table hasn't been analyzed or the backend has no such statistics.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    elif connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has run
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a whole large table.
+
+    An unfiltered changelist takes its total from planner statistics once
+    the table holds at least ADMIN_COUNT_LIMIT rows. Anything else is
+    counted exactly, but only up to ADMIN_COUNT_LIMIT rows or through the
+    requested page, whichever is further. When rows remain past that point
+    the count is a lower bound: count_is_lower_bound is set and one more
+    page is offered, so every page stays reachable one step at a time.
+    """
+
+    def __init__(self, *args, page=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            self.requested_page = max(int(page), 1)
+        except (TypeError, ValueError):
+            self.requested_page = 1
+        self.count_is_lower_bound = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= limit:
+                return estimate
+        limit = max(limit, self.requested_page * self.per_page)
+        counted = queryset.order_by()[:limit + 1].count()
+        self.count_is_lower_bound = counted > limit
+        return min(counted, limit)
+
+    @cached_property
+    def num_pages(self):
+        pages = super().num_pages
+        # Visiting the extra page counts further
+        return pages + 1 if self.count_is_lower_bound else pages
+
+
+def _next_prefix(term):
+    """Smallest string greater than every string starting with term."""
+    return term[:-1] + chr(min(ord(term[-1]) + 1, 0x10FFFF))
+
+
+def _indexed_lookup(model, path, term, prefix):
+    """
+    Q matching `path` against term with an index-friendly lookup.
+
+    Related paths become nested `__in` subqueries, so the outer table is
+    filtered on its own foreign key column rather than through a join.
+    """
+    name, _, rest = path.partition('__')
+    if rest:
+        related = model._meta.get_field(name).related_model
+        return Q(**{f'{name}__in': related._default_manager.filter(_indexed_lookup(related, rest, term, prefix))})
+    if prefix:
+        return Q(**{f'{name}__gte': term, f'{name}__lt': _next_prefix(term)})
+    return Q(**{name: term})
+
+
+class ScalableAdminMixin:
+    """
+    Changelist defaults for tables too large to count or scan.
+
+    Pages are counted with EstimatedCountPaginator and the unfiltered total
+    next to a filtered result is not shown. Search fields prefixed with `=`
+    match exactly and with `^` by prefix; both are case-sensitive so the
+    database can answer them from an index on the field (a prefix becomes
+    a range), which search_help_text should say. Unprefixed fields keep
+    Django's icontains search.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, page=request.GET.get(PAGE_VAR, 1))
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        fields = self.get_search_fields(request)
+        if not term or not all(field[:1] in ('=', '^') for field in fields):
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q()
+        for field in fields:
+            condition |= _indexed_lookup(self.model, field[1:], term, field.startswith('^'))
+        return queryset.filter(condition), False
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Replica alias the current request may read from; None means primary only.
+# Set by ReplicaRoutingMiddleware, so commands, the shell and tests always
+# read from the primary.
+_replica = ContextVar('db_replica', default=None)
+# Whether anything was written during the current request.
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def use_replica(alias):
+    """Route the current context's reads to `alias` (or the primary for None)."""
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    _replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, whatever the request chose.
+
+    For reads whose result is shared, such as cache fills: a lagging
+    replica would otherwise hand every later reader, including the user
+    who just wrote, a stale copy until the cache entry expires.
+    """
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def track_writes():
+    return _wrote.set(False)
+
+
+def has_written():
+    return _wrote.get()
+
+
+def reset_writes(token):
+    _wrote.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and reads to the request's chosen replica.
+
+    The first write in a request pins the rest of it to the primary so
+    it reads its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        _replica.set(None)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Lets `migrate --database=replica_1` prepare local SQLite replicas
+        return True
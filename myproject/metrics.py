@@ -0,0 +1,209 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class RequestStats:
+    """Time spent in the database, Redis and named phases during one request."""
+    __slots__ = ('db_queries', 'db_seconds', 'redis_calls', 'redis_seconds', 'phases')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+        self.phases = {}
+
+
+# Shared by reference with sync_to_async threads, so ORM calls made from
+# async views are counted too
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def record_redis(seconds):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.redis_calls += 1
+        stats.redis_seconds += seconds
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to a named phase of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.phases[phase] = stats.phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Wrappers live on the per-thread connection object, which outlives reconnects
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, count, total) in sorted(self._series.items()):
+                labels = _format_labels(self.labels, label_values)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{self.name}_count{{{labels}}} {count}')
+                lines.append(f'{self.name}_sum{{{labels}}} {total}')
+        return lines
+
+
+class Counter:
+    """Prometheus-style counter keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._series.items()):
+                lines.append(f'{self.name}{{{_format_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _format_labels(names, values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency by view.', ('view', 'method'), LATENCY_BUCKETS
+)
+response_size = Histogram('http_response_size_bytes', 'Response body size by view.', ('view',), SIZE_BUCKETS)
+requests_total = Counter('http_requests_total', 'Requests by view and status.', ('view', 'method', 'status'))
+db_queries_total = Counter('http_request_db_queries_total', 'SQL queries issued by view.', ('view',))
+db_seconds_total = Counter('http_request_db_seconds_total', 'Time spent in SQL queries by view.', ('view',))
+redis_calls_total = Counter('http_request_redis_calls_total', 'Redis commands issued by view.', ('view',))
+redis_seconds_total = Counter('http_request_redis_seconds_total', 'Time spent in Redis commands by view.', ('view',))
+phase_seconds_total = Counter('http_request_phase_seconds_total', 'Time spent in named phases by view.', ('view', 'phase'))
+
+REQUEST_METRICS = (
+    request_duration, response_size, requests_total, db_queries_total, db_seconds_total,
+    redis_calls_total, redis_seconds_total, phase_seconds_total,
+)
+
+
+def observe_request(view, method, status, seconds, size, stats):
+    request_duration.observe((view, method), seconds)
+    requests_total.inc((view, method, str(status)))
+    if size is not None:
+        response_size.observe((view,), size)
+    db_queries_total.inc((view,), stats.db_queries)
+    db_seconds_total.inc((view,), stats.db_seconds)
+    redis_calls_total.inc((view,), stats.redis_calls)
+    redis_seconds_total.inc((view,), stats.redis_seconds)
+    for phase, phase_seconds in stats.phases.items():
+        phase_seconds_total.inc((view, phase), phase_seconds)
+
+
+def server_timing(total, stats):
+    """Build a Server-Timing header value (durations in milliseconds)."""
+    entries = [
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.db_queries} queries"',
+        f'redis;dur={stats.redis_seconds * 1000:.2f};desc="{stats.redis_calls} calls"',
+    ]
+    entries += [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in stats.phases.items()]
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def _gauges(prefix, values):
+    """Flatten a (possibly nested) dict of numbers into gauge lines."""
+    lines = []
+    for key, value in sorted(values.items()):
+        name = f'{prefix}_{key}'
+        if isinstance(value, dict):
+            lines += _gauges(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines += [f'# TYPE {name} gauge', f'{name} {value}']
+    return lines
+
+
+def render():
+    """All metrics of this process in the Prometheus text exposition format."""
+    from accounts.hashing import hashing_limiter
+    from accounts.middleware import cache_stats
+    from accounts.redis_utils import redis_breaker, redis_stats
+    from wallet.outbox import queue_metrics
+    from .ratelimit import in_flight_limiter
+
+    lines = []
+    for metric in REQUEST_METRICS:
+        lines += metric.render()
+    lines += _gauges('auth_cache', cache_stats())
+    lines += _gauges('redis', redis_stats())
+    lines += ['# TYPE redis_breaker_open gauge', f'redis_breaker_open {int(redis_breaker.state != "closed")}']
+    lines += _gauges('password_hash', hashing_limiter.stats())
+    lines += _gauges('stripe_outbox', queue_metrics())
+    lines += _gauges('load_shed', in_flight_limiter.stats())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,249 @@
+import random
+import time
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from accounts.circuit_breaker import CircuitOpenError
+from accounts.redis_utils import get_async_redis, redis_breaker, redis_client
+from . import metrics
+from .ratelimit import acheck_rate_limit, check_rate_limit, in_flight_limiter
+from .responses import JsonResponse
+from .db_router import has_written, reset_replica, reset_writes, track_writes, use_replica
+
+LAST_WRITE_PREFIX = 'db_last_write:'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Never shed: scrapes must keep working while the process is overloaded
+LOAD_SHED_EXEMPT = ('/metrics',)
+
+
+def retry_later(error, status, retry_after):
+    response = JsonResponse({'error': error}, status=status)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class InstrumentationMiddleware:
+    """
+    Measure each request and add a Server-Timing header.
+
+    Records latency, SQL and Redis time and call counts, named phases
+    (such as JWT authentication) and response size per view for the
+    /metrics endpoint. Place it before JWTAuthenticationMiddleware so
+    authentication is included in the measurement.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, stats, time.perf_counter() - start)
+
+    def _finish(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        metrics.observe_request(view, request.method, response.status_code, elapsed, size, stats)
+        response['Server-Timing'] = metrics.server_timing(elapsed, stats)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let safe requests read from a replica unless the user wrote recently.
+
+    After a request that wrote, the user is kept on the primary for
+    REPLICA_LAG_WINDOW seconds so they read their own writes even if the
+    replicas are lagging. Must come after JWTAuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _user_id(request):
+        user = getattr(request, 'user', None)
+        return user.id if user is not None and user.is_authenticated else None
+
+    def _wants_replica(self, request):
+        return bool(settings.DATABASE_REPLICAS) and request.method in SAFE_METHODS
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        user_id = self._user_id(request)
+        replica = None
+        if self._wants_replica(request) and not self._recently_wrote(user_id):
+            replica = random.choice(settings.DATABASE_REPLICAS)
+
+        replica_token = use_replica(replica)
+        writes_token = track_writes()
+        try:
+            response = self.get_response(request)
+            if has_written() and user_id is not None:
+                self._record_write(user_id)
+            return response
+        finally:
+            reset_writes(writes_token)
+            reset_replica(replica_token)
+
+    async def __acall__(self, request):
+        user_id = self._user_id(request)
+        replica = None
+        if self._wants_replica(request) and not await self._arecently_wrote(user_id):
+            replica = random.choice(settings.DATABASE_REPLICAS)
+
+        replica_token = use_replica(replica)
+        writes_token = track_writes()
+        try:
+            response = await self.get_response(request)
+            if has_written() and user_id is not None:
+                await self._arecord_write(user_id)
+            return response
+        finally:
+            reset_writes(writes_token)
+            reset_replica(replica_token)
+
+    def _recently_wrote(self, user_id):
+        if user_id is None:
+            return False
+        try:
+            return bool(redis_breaker.call(redis_client.exists, f'{LAST_WRITE_PREFIX}{user_id}'))
+        except (CircuitOpenError, redis.RedisError):
+            # Can't tell, so stay consistent and read from the primary
+            return True
+
+    async def _arecently_wrote(self, user_id):
+        if user_id is None:
+            return False
+        try:
+            return bool(await redis_breaker.acall(get_async_redis().exists, f'{LAST_WRITE_PREFIX}{user_id}'))
+        except (CircuitOpenError, redis.RedisError):
+            return True
+
+    def _record_write(self, user_id):
+        try:
+            redis_breaker.call(
+                redis_client.set, f'{LAST_WRITE_PREFIX}{user_id}', '1', px=int(settings.REPLICA_LAG_WINDOW * 1000)
+            )
+        except (CircuitOpenError, redis.RedisError):
+            pass
+
+    async def _arecord_write(self, user_id):
+        try:
+            await redis_breaker.acall(
+                get_async_redis().set, f'{LAST_WRITE_PREFIX}{user_id}', '1',
+                px=int(settings.REPLICA_LAG_WINDOW * 1000)
+            )
+        except (CircuitOpenError, redis.RedisError):
+            pass
+
+
+class LoadSheddingMiddleware:
+    """
+    Answer 503 straight away once LOAD_SHED_MAX_IN_FLIGHT requests are in progress.
+
+    The in-flight count is per process. Place it before
+    JWTAuthenticationMiddleware so a shed request costs no token check,
+    Redis call or query.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path in LOAD_SHED_EXEMPT:
+            return self.get_response(request)
+        if not in_flight_limiter.acquire():
+            return retry_later('Server overloaded, please retry', 503, 1)
+        try:
+            return self.get_response(request)
+        finally:
+            in_flight_limiter.release()
+
+    async def __acall__(self, request):
+        if request.path in LOAD_SHED_EXEMPT:
+            return await self.get_response(request)
+        if not in_flight_limiter.acquire():
+            return retry_later('Server overloaded, please retry', 503, 1)
+        try:
+            return await self.get_response(request)
+        finally:
+            in_flight_limiter.release()
+
+
+class RateLimitMiddleware:
+    """
+    Apply the RATE_LIMITS configured for the resolved route.
+
+    Runs in process_view, after the URL is resolved and the user is
+    authenticated, so it must come after JWTAuthenticationMiddleware.
+    Rejected requests get 429 with Retry-After before the view runs.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        retry_after = check_rate_limit(request, request.resolver_match.url_name)
+        if retry_after:
+            return retry_later('Too many requests', 429, retry_after)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        retry_after = await acheck_rate_limit(request, request.resolver_match.url_name)
+        if retry_after:
+            return retry_later('Too many requests', 429, retry_after)
+        return None
@@ -0,0 +1,137 @@
+import base64
+import json
+from datetime import datetime
+from django.db.models import Q
+
+
+# Ids in a cursor must fit a signed 64-bit integer column
+MIN_ID = -2 ** 63
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk, direction):
+    """Build an opaque cursor pointing at a (created_at, id) position."""
+    raw = json.dumps({'c': created_at.isoformat(), 'i': pk, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Parse a cursor built by encode_cursor into (created_at, id, direction)."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = datetime.fromisoformat(data['c'])
+        pk = int(data['i'])
+        direction = data['d']
+    except (ValueError, TypeError, KeyError, OverflowError):
+        raise InvalidCursor('Invalid cursor')
+    if direction not in ('next', 'prev') or not MIN_ID <= pk <= MAX_ID:
+        raise InvalidCursor('Invalid cursor')
+    return created_at, pk, direction
+
+
+def normalize_cursor(cursor):
+    """
+    Validate a client-supplied cursor and return it in canonical form.
+
+    Returns '' when there is no cursor and raises InvalidCursor for
+    anything decode_cursor rejects, so equivalent cursors share one
+    spelling, e.g. in cache keys.
+    """
+    if not cursor:
+        return ''
+    return encode_cursor(*decode_cursor(cursor))
+
+
+def encode_offset_cursor(offset):
+    """Build an opaque cursor for results that can only be paged by position, such as ranked search."""
+    raw = json.dumps({'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_offset_cursor(cursor, max_offset):
+    """Parse a cursor built by encode_offset_cursor into an offset of at most max_offset."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = int(json.loads(base64.urlsafe_b64decode(padded.encode()))['o'])
+    except (ValueError, TypeError, KeyError, OverflowError):
+        raise InvalidCursor('Invalid cursor')
+    if not 0 <= offset <= max_offset:
+        raise InvalidCursor('Invalid cursor')
+    return offset
+
+
+def parse_limit(value, default, maximum):
+    """Validate a ?limit= query parameter, falling back to the default."""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f'limit must be an integer between 1 and {maximum}')
+    if limit < 1 or limit > maximum:
+        raise ValueError(f'limit must be an integer between 1 and {maximum}')
+    return limit
+
+
+def _page_queryset(queryset, cursor, limit):
+    """Return (queryset, direction) that fetches one page plus one lookahead row."""
+    if not cursor:
+        return queryset.order_by('-created_at', '-id')[:limit + 1], 'next'
+
+    # The bare range on created_at lets the database seek straight to the
+    # cursor in the (created_at, id) index; the OR only settles ties.
+    created_at, pk, direction = decode_cursor(cursor)
+    if direction == 'next':
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+            created_at__lte=created_at,
+        ).order_by('-created_at', '-id')
+    else:
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+            created_at__gte=created_at,
+        ).order_by('created_at', 'id')
+    return queryset[:limit + 1], direction
+
+
+def _page_result(rows, cursor, limit, direction):
+    """Trim the lookahead row and build the (items, next_cursor, prev_cursor) tuple."""
+    if direction == 'next':
+        has_next = len(rows) > limit
+        has_prev = bool(cursor)
+        rows = rows[:limit]
+    else:
+        has_prev = len(rows) > limit
+        has_next = True
+        rows = rows[:limit][::-1]
+
+    next_cursor = None
+    prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk, 'next')
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0].created_at, rows[0].pk, 'prev')
+    return rows, next_cursor, prev_cursor
+
+
+def keyset_paginate(queryset, cursor=None, limit=20):
+    """
+    Paginate a queryset newest first on (created_at, id).
+
+    Each page is a range read starting at the cursor position, so fetching
+    page 1000 costs the same as fetching page 1. Returns a tuple of
+    (items, next_cursor, prev_cursor).
+    """
+    queryset, direction = _page_queryset(queryset, cursor, limit)
+    return _page_result(list(queryset), cursor, limit, direction)
+
+
+async def akeyset_paginate(queryset, cursor=None, limit=20):
+    """Async version of keyset_paginate."""
+    queryset, direction = _page_queryset(queryset, cursor, limit)
+    return _page_result([row async for row in queryset], cursor, limit, direction)
@@ -0,0 +1,126 @@
+import math
+import threading
+import uuid
+import redis
+from django.conf import settings
+from accounts.circuit_breaker import CircuitOpenError
+from accounts.redis_utils import get_async_script, redis_breaker, redis_client
+
+KEY_PREFIX = 'ratelimit:'
+
+# Sliding-window log over one sorted set per (route, scope, client), all
+# checked in one atomic round trip. ARGV is the request's member followed
+# by a (limit, window in ms) pair per key. Either every window admits the
+# request and it is recorded in all of them, or none is touched and the
+# script returns the milliseconds until the fullest window frees a slot.
+SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now)
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[1])
+    redis.call('PEXPIRE', key, ARGV[i * 2 + 1])
+end
+return 0
+"""
+
+sliding_window = redis_client.register_script(SLIDING_WINDOW_LUA)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def route_limits(request, url_name):
+    """Return (keys, args) for the limits configured for a route, or None if it has none."""
+    limits = settings.RATE_LIMITS.get(url_name)
+    if not limits:
+        return None
+    keys = []
+    args = [uuid.uuid4().hex]
+    for scope, (limit, window) in sorted(limits.items()):
+        if scope == 'user':
+            if not getattr(request, 'user', None) or not request.user.is_authenticated:
+                continue
+            identity = request.user.id
+        else:
+            identity = client_ip(request)
+        keys.append(f'{KEY_PREFIX}{url_name}:{scope}:{identity}')
+        args += [limit, int(window * 1000)]
+    return (keys, args) if keys else None
+
+
+def _retry_after(milliseconds):
+    """Whole seconds for a Retry-After header, or None when the request is allowed."""
+    return math.ceil(milliseconds / 1000) if milliseconds else None
+
+
+def check_rate_limit(request, url_name):
+    """
+    Count the request against its route's limits.
+
+    Returns None when it is allowed, or the number of seconds to wait.
+    Requests are let through while Redis is unavailable.
+    """
+    limits = route_limits(request, url_name)
+    if limits is None:
+        return None
+    keys, args = limits
+    try:
+        return _retry_after(redis_breaker.call(sliding_window, keys, args))
+    except (CircuitOpenError, redis.RedisError):
+        return None
+
+
+async def acheck_rate_limit(request, url_name):
+    """Async version of check_rate_limit."""
+    limits = route_limits(request, url_name)
+    if limits is None:
+        return None
+    keys, args = limits
+    try:
+        return _retry_after(await redis_breaker.acall(get_async_script(SLIDING_WINDOW_LUA), keys, args))
+    except (CircuitOpenError, redis.RedisError):
+        return None
+
+
+class InFlightLimiter:
+    """Count requests in progress in this process and refuse new ones past `max_in_flight`."""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return True and take a slot, or False if the process is overloaded."""
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'max_in_flight': self.max_in_flight, 'in_flight': self.in_flight, 'shed': self.shed}
+
+
+in_flight_limiter = InFlightLimiter(settings.LOAD_SHED_MAX_IN_FLIGHT)
@@ -0,0 +1,66 @@
+import datetime
+import decimal
+import json
+import uuid
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same output, only slower
+    orjson = None
+
+
+def _default(obj):
+    """Encode the types our views return that JSON has no native form for."""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class _Encoder(json.JSONEncoder):
+    def default(self, obj):
+        return _default(obj)
+
+
+_stdlib_encoder = _Encoder(separators=(',', ':'), ensure_ascii=False)
+
+
+def dumps(data):
+    """
+    Serialize data to compact UTF-8 JSON bytes.
+
+    Datetimes become ISO 8601 strings and Decimals become strings (so
+    money keeps its exact digits). Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return _stdlib_encoder.encode(data).encode()
+
+
+class JsonResponse(HttpResponse):
+    """Drop-in replacement for django.http.JsonResponse that serializes with dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+async def aiter_chunks(chunks):
+    """
+    Async iterator over a sync chunk generator, for StreamingHttpResponse under ASGI.
+
+    Django buffers a sync iterator into a list before sending it from an
+    async handler; this fetches one chunk at a time on the sync thread
+    instead, so the database cursor behind it stays on one thread and the
+    first chunk goes out before the rest is read.
+    """
+    _done = object()
+    fetch = sync_to_async(next)
+    try:
+        while (chunk := await fetch(chunks, _done)) is not _done:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
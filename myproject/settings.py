@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'accounts',
     'posts',
     'wallet',
+    'benchmarks',
 ]
 
 AUTH_USER_MODEL = 'accounts.User'
@@ -56,7 +57,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'myproject.middleware.InstrumentationMiddleware',
+    'myproject.middleware.LoadSheddingMiddleware',
     'accounts.middleware.JWTAuthenticationMiddleware',
+    'myproject.middleware.RateLimitMiddleware',
+    'myproject.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -64,7 +69,8 @@ ROOT_URLCONF = 'myproject.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        # Admin template overrides (a capped changelist count shows as a lower bound)
+        'DIRS': [BASE_DIR / 'myproject' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -78,6 +84,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
 
+# Serve the read endpoints with async views; enable when running under
+# an ASGI server (myproject.asgi) so requests never hop to a thread.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Bearer token required by GET /metrics; the endpoint is disabled when unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -86,13 +99,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for the write lock instead of failing under concurrent writes,
+            # and take it when a transaction starts so it never has to upgrade.
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_PATHS=/data/replica1.sqlite3,/data/replica2.sqlite3
+# (other engines can be added to DATABASES by hand and listed in DATABASE_REPLICAS)
+DATABASE_REPLICAS = []
+for i, replica_path in enumerate(filter(None, os.getenv('DATABASE_REPLICA_PATHS', '').split(',')), start=1):
+    DATABASES[f'replica_{i}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': replica_path,
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{i}')
+
+DATABASE_ROUTERS = ['myproject.db_router.PrimaryReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write
+REPLICA_LAG_WINDOW = float(os.getenv('REPLICA_LAG_WINDOW', 5))
+
+# Requests a worker process serves at once before answering 503 (0 disables)
+LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv('LOAD_SHED_MAX_IN_FLIGHT', 200))
+
+# Sliding-window limits per URL name: {scope: (requests, window in seconds)}.
+# The 'ip' scope counts per client address, 'user' per authenticated user.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMITS = {
+    'login': {'ip': (10, 60)},
+    'register': {'ip': (5, 3600)},
+    'create_post': {'user': (30, 60), 'ip': (60, 60)},
+    'batch_create_posts': {'user': (10, 60)},
+    'wallet_fund': {'user': (10, 60), 'ip': (20, 60)},
+    'get_all_posts': {'user': (120, 60), 'ip': (300, 60)},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Password hashing runs on a bounded thread pool; requests that can't get a
+# slot within the timeout are answered with 503
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 2))  # seconds
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -135,12 +191,58 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 REDIS_DB = int(os.getenv('REDIS_DB', 0))
-TOKEN_BLACKLIST_TTL = int(os.getenv('TOKEN_BLACKLIST_TTL', 60 * 60 * 24 * 2))  # 2 days in seconds
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 0.5))  # seconds to wait for a free connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.25))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 0.25))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+REDIS_RETRIES = int(os.getenv('REDIS_RETRIES', 1))
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv('REDIS_BREAKER_FAILURE_THRESHOLD', 5))
+REDIS_BREAKER_RESET_TIMEOUT = float(os.getenv('REDIS_BREAKER_RESET_TIMEOUT', 10))  # seconds
+REDIS_FAILURE_POLICY = os.getenv('REDIS_FAILURE_POLICY', 'open')  # "open" accepts tokens while Redis is down, "closed" returns 503
+TOKEN_BLACKLIST_TTL = int(os.getenv('TOKEN_BLACKLIST_TTL', 60 * 60 * 24 * 2))  # 2 days in seconds, retention of the revocation index
+BLACKLIST_FILTER_CAPACITY = int(os.getenv('BLACKLIST_FILTER_CAPACITY', 100000))
+BLACKLIST_FILTER_ERROR_RATE = float(os.getenv('BLACKLIST_FILTER_ERROR_RATE', 0.001))
+BLACKLIST_FILTER_SYNC_INTERVAL = float(os.getenv('BLACKLIST_FILTER_SYNC_INTERVAL', 5))  # seconds
+BLACKLIST_FILTER_REBUILD_INTERVAL = int(os.getenv('BLACKLIST_FILTER_REBUILD_INTERVAL', 60 * 60))  # seconds
+
+# In-process authentication caches (per worker)
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))  # seconds, never past the token's exp
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 10000))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))  # seconds
+AUTH_EPOCH_CACHE_TTL = int(os.getenv('AUTH_EPOCH_CACHE_TTL', 5))  # seconds a "revoke all sessions" or user change may take to reach other workers
+
+# User fields embedded in tokens; requests that only read these never load the user row
+JWT_USER_CLAIMS = [claim for claim in os.getenv('JWT_USER_CLAIMS', 'email,user_type,is_active').split(',') if claim]
 
 # Stripe configuration
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv('STRIPE_EVENT_MAX_ATTEMPTS', 5))  # before a queued event is marked failed
+STRIPE_EVENT_RETRY_DELAY = float(os.getenv('STRIPE_EVENT_RETRY_DELAY', 30))  # seconds before the first retry, doubled after each failure
+STRIPE_EVENT_RETRY_MAX_DELAY = float(os.getenv('STRIPE_EVENT_RETRY_MAX_DELAY', 3600))  # seconds
+
+# Seconds a cached wallet balance lives without a write; bounds staleness if a write-through is lost
+WALLET_CACHE_TTL = int(os.getenv('WALLET_CACHE_TTL', 300))
 
 # Post creation cost
 POST_CREATION_COST = os.getenv('POST_CREATION_COST', '0.25') # Cost in dollars
+
+# Posts listing pagination
+POSTS_PAGE_SIZE = int(os.getenv('POSTS_PAGE_SIZE', 20))
+POSTS_MAX_PAGE_SIZE = int(os.getenv('POSTS_MAX_PAGE_SIZE', 100))
+POSTS_EXPORT_CHUNK_SIZE = int(os.getenv('POSTS_EXPORT_CHUNK_SIZE', 2000))  # rows fetched per DB round trip
+POSTS_SEARCH_MAX_OFFSET = int(os.getenv('POSTS_SEARCH_MAX_OFFSET', POSTS_MAX_PAGE_SIZE * 10))  # deepest ranked search result a cursor can reach
+TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', 50))
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv('TRANSACTIONS_MAX_PAGE_SIZE', 500))
+TRANSACTIONS_EXPORT_CHUNK_SIZE = int(os.getenv('TRANSACTIONS_EXPORT_CHUNK_SIZE', 2000))  # rows fetched per DB round trip
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', 10000))  # rows an admin changelist counts before estimating or stopping
+POST_BATCH_MAX_SIZE = int(os.getenv('POST_BATCH_MAX_SIZE', 100))  # posts or ids per batch request
+
+# Posts response cache
+POSTS_CACHE_ENABLED = os.getenv('POSTS_CACHE_ENABLED', 'True').lower() == 'true'
+POSTS_CACHE_TTL = int(os.getenv('POSTS_CACHE_TTL', 300))  # seconds
+POSTS_CACHE_LOCK_TIMEOUT = int(os.getenv('POSTS_CACHE_LOCK_TIMEOUT', 5))  # seconds a rebuild may hold the lock
+POSTS_CACHE_WAIT = float(os.getenv('POSTS_CACHE_WAIT', 0.2))  # seconds to wait for another worker's rebuild before building too
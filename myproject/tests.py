@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+from django.db import connection, connections
+from django.test import RequestFactory, TestCase, override_settings
+from accounts.models import User
+from accounts.redis_utils import redis_client
+from posts import views as post_views
+from posts.cache import bump_generation
+from posts.models import Post
+from wallet.balance_cache import evict_wallet
+from wallet.models import Wallet
+from .db_router import PrimaryReplicaRouter, has_written, primary_reads, reset_replica, use_replica
+from .middleware import LAST_WRITE_PREFIX, ReplicaRoutingMiddleware
+from .responses import JsonResponse
+
+REPLICA = 'replica_test'
+
+
+class ReplicaRoutingTests(TestCase):
+    """
+    Reads go to a replica unless the user just wrote or the result is cached for everyone.
+
+    The replica is a second SQLite file copied from the test database
+    before any test data exists, so it behaves like a replica that hasn't
+    caught up with any of the writes below.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        path = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [path])
+        connections.settings[REPLICA] = {**connection.settings_dict, 'NAME': path}
+        # Declared here rather than on the class, so the test runner doesn't
+        # try to create a test database for an alias that doesn't exist yet
+        cls.databases = {'default', REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='replica@example.com', password=None, first_name='Rita', last_name='Plica',
+            dob=date(1990, 1, 1), user_type='editor',
+        )
+        Wallet.objects.filter(user=cls.user).update(balance=Decimal('7.00'))
+        cls.post = Post.objects.create(title='Fresh', description='Only on the primary', rating=4, author=cls.user)
+
+    def setUp(self):
+        # Redis outlives each test's rollback
+        redis_client.delete(f'{LAST_WRITE_PREFIX}{self.user.id}')
+        evict_wallet(self.user.id)
+        bump_generation()
+
+    def on_replica(self):
+        token = use_replica(REPLICA)
+        self.addCleanup(reset_replica, token)
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        self.on_replica()
+        self.assertEqual(router.db_for_read(Post), REPLICA)
+        with primary_reads():
+            self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(router.db_for_read(Post), REPLICA)
+        # The first write pins the rest of the request to the primary
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertTrue(has_written())
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_reads_own_writes(self):
+        def view(request):
+            if request.method == 'POST':
+                Post.objects.create(title='New', description='Body', rating=3, author=request.user)
+            return JsonResponse({'posts': Post.objects.count()})
+
+        middleware = ReplicaRoutingMiddleware(view)
+
+        def call(method):
+            request = getattr(RequestFactory(), method)('/posts/')
+            request.user = self.user
+            return json.loads(middleware(request).content)['posts']
+
+        # The lagging replica has none of the posts yet
+        self.assertEqual(call('get'), 0)
+        self.assertEqual(call('post'), 2)
+        # Within REPLICA_LAG_WINDOW of that write this user reads the primary
+        self.assertEqual(call('get'), 2)
+
+    @override_settings(POSTS_CACHE_ENABLED=True)
+    def test_cache_fill_reads_primary(self):
+        self.on_replica()
+        request = RequestFactory().get(f'/posts/{self.post.id}/')
+        request.user = self.user
+        self.assertEqual(post_views.get_post(request, post_id=self.post.id).status_code, 200)
+
+    @override_settings(POSTS_CACHE_ENABLED=False)
+    def test_uncached_reads_use_replica(self):
+        self.on_replica()
+        request = RequestFactory().get(f'/posts/{self.post.id}/')
+        request.user = self.user
+        self.assertEqual(post_views.get_post(request, post_id=self.post.id).status_code, 404)
+
+    def test_wallet_cache_fill_reads_primary(self):
+        self.on_replica()
+        wallet = Wallet.objects.for_user(self.user.id)
+        self.assertEqual(wallet.balance, Decimal('7.00'))
@@ -21,6 +21,7 @@ from . import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.homepage),
+    path('metrics', views.metrics_view, name='metrics'),
     path('auth/', include('accounts.urls')),
     path('posts/', include('posts.urls')),
     path('wallet/', include('wallet.urls')),
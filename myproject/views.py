@@ -1,4 +1,22 @@
+import hmac
+from django.conf import settings
 from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+from . import metrics
+from .responses import JsonResponse
 
 def homepage(request): 
-  return HttpResponse("Server is running!!!");
\ No newline at end of file
+  return HttpResponse("Server is running!!!");
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """Prometheus metrics for this process, for scrapers holding METRICS_TOKEN."""
+    if not settings.METRICS_TOKEN:
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    auth_header = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth_header.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()):
+        return JsonResponse({'error': 'Invalid metrics token'}, status=401)
+
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
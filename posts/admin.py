@@ -1,10 +1,60 @@
 from django.contrib import admin
+from django.db import transaction
+from myproject.admin_utils import ScalableAdminMixin
+from .cache import bump_generation
 from .models import Post
+from .ratings import RATINGS, delete_posts, record_rating_changes
+from . import search
+
+
+class RatingFilter(admin.SimpleListFilter):
+    """Filter by rating from a fixed list instead of a SELECT DISTINCT over every post."""
+
+    title = 'rating'
+    parameter_name = 'rating'
+
+    def lookups(self, request, model_admin):
+        return [(str(rating), str(rating)) for rating in RATINGS]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(rating=self.value())
+        return queryset
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'rating', 'created_at', 'updated_at')
-    list_filter = ('rating', 'created_at')
+class PostAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'author', 'rating', 'created_at', 'updated_at')
+    list_filter = (RatingFilter, 'created_at')
+    list_select_related = ('author',)
     search_fields = ('title', 'description')
+    autocomplete_fields = ('author',)
     ordering = ('-created_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the FTS5 index where it exists instead of LIKE scans
+        if search_term.strip() and search.is_supported(queryset.db):
+            return search.filter_matching(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    # Admin writes go through the same aggregate deltas and cache bump as the API
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            changes = [(obj.author_id, None, obj.rating)]
+            if change:
+                old = Post.objects.select_for_update().values_list('author_id', 'rating').get(pk=obj.pk)
+                changes.append((old[0], old[1], None))
+            super().save_model(request, obj, form, change)
+            record_rating_changes(changes)
+        transaction.on_commit(bump_generation)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            delete_posts(Post.objects.select_for_update().filter(pk=obj.pk))
+        transaction.on_commit(bump_generation)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            delete_posts(queryset.select_for_update(of=('self',)))
+        transaction.on_commit(bump_generation)
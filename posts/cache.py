@@ -0,0 +1,160 @@
+import asyncio
+import time
+import uuid
+import redis
+from django.conf import settings
+from accounts.redis_utils import get_async_redis, get_async_script, redis_client
+from myproject.db_router import primary_reads
+
+CACHE_PREFIX = 'posts_cache:'
+GENERATION_KEY = f'{CACHE_PREFIX}generation'
+LOCK_PREFIX = f'{CACHE_PREFIX}lock:'
+
+# Delete the lock only if we still own it, so a slow builder can't release
+# a lock that already expired and was taken by another worker.
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+
+def get_generation():
+    """Return the current cache generation for post responses."""
+    return redis_client.get(GENERATION_KEY) or '0'
+
+
+def bump_generation():
+    """Invalidate every cached post response by moving to a new generation."""
+    if not settings.POSTS_CACHE_ENABLED:
+        return
+    try:
+        redis_client.incr(GENERATION_KEY)
+    except redis.RedisError:
+        # Stale entries still expire after POSTS_CACHE_TTL.
+        pass
+
+
+def _pack(status, body):
+    return b'%d:%s' % (status, body)
+
+
+def _unpack(value):
+    status, body = value.split(':', 1)
+    return int(status), body
+
+
+def _cacheable(status):
+    return 200 <= status < 300
+
+
+def _wait_delays():
+    """Poll intervals while another worker rebuilds, backing off and stopping after POSTS_CACHE_WAIT seconds."""
+    delay, waited = 0.005, 0
+    while waited < settings.POSTS_CACHE_WAIT:
+        delay = min(delay, settings.POSTS_CACHE_WAIT - waited)
+        yield delay
+        waited += delay
+        delay = min(delay * 2, 0.05)
+
+
+def cached_json(name, build):
+    """
+    Return (status, body) for a post response, serving it from Redis when possible.
+
+    `build` is called on a miss and must return (status, json_body); only
+    2xx responses are stored, and a build that fills the cache reads from
+    the primary database. Only one worker rebuilds a given key at a
+    time; the others wait up to POSTS_CACHE_WAIT for its result and then
+    build it themselves. Any Redis failure falls back to calling `build`
+    directly. `name` must only hold validated values, since every distinct
+    name is a separate cache entry.
+    """
+    if not settings.POSTS_CACHE_ENABLED:
+        return build()
+
+    try:
+        key = f'{CACHE_PREFIX}{get_generation()}:{name}'
+        cached = redis_client.get(key)
+        if cached is not None:
+            return _unpack(cached)
+
+        lock_key = f'{LOCK_PREFIX}{key}'
+        lock_token = uuid.uuid4().hex
+        acquired = redis_client.set(lock_key, lock_token, nx=True, ex=settings.POSTS_CACHE_LOCK_TIMEOUT)
+    except redis.RedisError:
+        return build()
+
+    if acquired:
+        try:
+            with primary_reads():
+                status, body = build()
+            if _cacheable(status):
+                try:
+                    redis_client.set(key, _pack(status, body), ex=settings.POSTS_CACHE_TTL)
+                except redis.RedisError:
+                    pass
+            return status, body
+        finally:
+            try:
+                _release_lock(keys=[lock_key], args=[lock_token])
+            except redis.RedisError:
+                pass
+
+    # Another worker is building this response; wait briefly for it to land.
+    try:
+        for delay in _wait_delays():
+            time.sleep(delay)
+            cached = redis_client.get(key)
+            if cached is not None:
+                return _unpack(cached)
+    except redis.RedisError:
+        pass
+    return build()
+
+
+async def acached_json(name, build):
+    """Async version of cached_json; `build` is a coroutine function."""
+    if not settings.POSTS_CACHE_ENABLED:
+        return await build()
+
+    client = get_async_redis()
+    try:
+        key = f'{CACHE_PREFIX}{await client.get(GENERATION_KEY) or "0"}:{name}'
+        cached = await client.get(key)
+        if cached is not None:
+            return _unpack(cached)
+
+        lock_key = f'{LOCK_PREFIX}{key}'
+        lock_token = uuid.uuid4().hex
+        acquired = await client.set(lock_key, lock_token, nx=True, ex=settings.POSTS_CACHE_LOCK_TIMEOUT)
+    except redis.RedisError:
+        return await build()
+
+    if acquired:
+        try:
+            with primary_reads():
+                status, body = await build()
+            if _cacheable(status):
+                try:
+                    await client.set(key, _pack(status, body), ex=settings.POSTS_CACHE_TTL)
+                except redis.RedisError:
+                    pass
+            return status, body
+        finally:
+            try:
+                await get_async_script(RELEASE_LOCK_SCRIPT)(keys=[lock_key], args=[lock_token])
+            except redis.RedisError:
+                pass
+
+    try:
+        for delay in _wait_delays():
+            await asyncio.sleep(delay)
+            cached = await client.get(key)
+            if cached is not None:
+                return _unpack(cached)
+    except redis.RedisError:
+        pass
+    return await build()
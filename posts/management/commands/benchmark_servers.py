@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from accounts.jwt_utils import generate_token
+from accounts.models import User
+from benchmarks.workload import latency_summary
+from posts.models import Post
+
+PATHS = ('/posts/?limit=20', '/wallet/balance/', '/wallet/transactions/')
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare read endpoint throughput through the WSGI handler with sync views '
+        'against the ASGI handler with async views, at high concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=200, help='Posts to seed for the listing.')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Leave the posts response cache on (measures Redis instead of the ORM).')
+        # Internal: run one side of the comparison in a child process
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), help='Run a single server mode.')
+        parser.add_argument('--token', help='Bearer token to use with --server.')
+
+    def handle(self, *args, **options):
+        if options['server']:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                run = self.run_wsgi if options['server'] == 'wsgi' else self.run_asgi
+                result = run(options['token'], options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(result))
+            return
+
+        user = User.objects.create_user(
+            email=f'bench-{uuid.uuid4().hex}@example.com',
+            password=None,
+            first_name='Bench',
+            last_name='User',
+            dob=date(2000, 1, 1),
+            user_type='editor',
+        )
+        try:
+            Post.objects.bulk_create(
+                Post(title=f'Post {i}', description='Benchmark ' * 20, rating=i % 5 + 1, author=user)
+                for i in range(options['posts'])
+            )
+            token = generate_token(user)
+            results = [self.spawn(server, token, options) for server in ('wsgi', 'asgi')]
+        finally:
+            user.delete()
+        self.stdout.write(json.dumps(results, indent=2))
+        if any(result['rate_limited_429'] for result in results):
+            raise CommandError('Requests were rate limited, so the throughput does not measure the views')
+
+    def spawn(self, server, token, options):
+        """Run one server mode in a fresh process so its URLconf picks the matching views."""
+        # Every request comes from one client address, so the rate limiter
+        # would otherwise answer most of them with 429
+        env = {**os.environ, 'ASYNC_VIEWS': 'True' if server == 'asgi' else 'False', 'RATE_LIMIT_ENABLED': 'False'}
+        if not options['with_cache']:
+            env['POSTS_CACHE_ENABLED'] = 'False'
+        proc = subprocess.run(
+            [sys.executable, '-m', 'django', 'benchmark_servers', '--server', server, '--token', token,
+             '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])],
+            env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise CommandError(f'{server} run failed:\n{proc.stderr}')
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    def run_wsgi(self, token, total, concurrency):
+        def fire(i):
+            start = time.perf_counter()
+            response = Client(headers={'Authorization': f'Bearer {token}'}).get(PATHS[i % len(PATHS)])
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fire, range(total)))
+        elapsed = time.perf_counter() - start
+        return self.report('wsgi', results, elapsed, concurrency)
+
+    def run_asgi(self, token, total, concurrency):
+        async def main():
+            client = AsyncClient()
+            headers = {'Authorization': f'Bearer {token}'}
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fire(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(PATHS[i % len(PATHS)], headers=headers)
+                    return time.perf_counter() - start, response.status_code
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(fire(i) for i in range(total)))
+            return results, time.perf_counter() - start
+
+        results, elapsed = asyncio.run(main())
+        return self.report('asgi', results, elapsed, concurrency)
+
+    @staticmethod
+    def report(server, results, elapsed, concurrency):
+        """Summarize [(latency, status)] for one server mode."""
+        return {
+            'server': server,
+            'concurrency': concurrency,
+            'seconds': round(elapsed, 3),
+            **latency_summary([latency for latency, _ in results], elapsed),
+            'rate_limited_429': sum(1 for _, status in results if status == 429),
+            'errors': sum(1 for _, status in results if status not in (200, 429)),
+        }
@@ -0,0 +1,25 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from posts.ratings import find_drift, rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Check the rating aggregates against the posts table, and rebuild them unless --check is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drift; exit non-zero if any row disagrees.')
+
+    def handle(self, *args, **options):
+        drift = find_drift()
+        for scope, (stored, expected) in sorted(drift.items(), key=lambda item: item[0] or 0):
+            self.stdout.write(json.dumps({'author': scope, 'stored': stored, 'expected': expected}))
+
+        if options['check']:
+            if drift:
+                raise CommandError(f'{len(drift)} rating aggregate rows have drifted.')
+            self.stdout.write(self.style.SUCCESS('Rating aggregates match the posts table.'))
+            return
+
+        rows = rebuild_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rating aggregate rows ({len(drift)} had drifted).'))
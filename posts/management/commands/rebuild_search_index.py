@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from posts.search import is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from the posts table (backfill or repair).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if not is_supported(options['database']):
+            raise CommandError('Full-text search is only available on SQLite (FTS5).')
+        indexed = rebuild_search_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts.'))
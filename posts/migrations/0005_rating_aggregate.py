@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:21
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_aggregates(apps, schema_editor):
+    """Create the global row and per-author rows from the posts already stored."""
+    Post = apps.get_model('posts', 'Post')
+    RatingAggregate = apps.get_model('posts', 'RatingAggregate')
+    counters = {
+        'post_count': models.Count('id'),
+        'rating_sum': models.Sum('rating', default=0),
+        **{f'count_{rating}': models.Count('id', filter=models.Q(rating=rating)) for rating in range(1, 6)},
+    }
+    rows = [RatingAggregate(author_id=None, **Post.objects.aggregate(**counters))]
+    rows += [
+        RatingAggregate(**row)
+        for row in Post.objects.order_by().values('author_id').annotate(**counters)
+    ]
+    RatingAggregate.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_post_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('count_1', models.PositiveIntegerField(default=0)),
+                ('count_2', models.PositiveIntegerField(default=0)),
+                ('count_3', models.PositiveIntegerField(default=0)),
+                ('count_4', models.PositiveIntegerField(default=0)),
+                ('count_5', models.PositiveIntegerField(default=0)),
+                ('author', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rating_aggregate', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('author', 0), name='rating_aggregate_single_global')],
+            },
+        ),
+        migrations.RunPython(seed_aggregates, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
 
 
 class Post(models.Model):
@@ -17,5 +18,45 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Newest-first listing and its keyset cursor
+            models.Index(fields=['created_at', 'id'], name='post_created_at_id_idx'),
+            models.Index(fields=['author', 'created_at'], name='post_author_created_at_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class RatingAggregate(models.Model):
+    """
+    Running rating totals for one author, or for all posts when author is null.
+
+    Kept up to date in the same transaction as every post write, so stats
+    are a single-row read instead of an aggregate over the posts table.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='rating_aggregate'
+    )
+    post_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    count_1 = models.PositiveIntegerField(default=0)
+    count_2 = models.PositiveIntegerField(default=0)
+    count_3 = models.PositiveIntegerField(default=0)
+    count_4 = models.PositiveIntegerField(default=0)
+    count_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # author is unique already, but NULLs never collide; this also
+            # allows only one global row
+            models.UniqueConstraint(Coalesce('author', 0), name='rating_aggregate_single_global'),
+        ]
+
+    def __str__(self):
+        return f'Ratings for {self.author or "all posts"}'
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from .models import Post, RatingAggregate
+
+RATINGS = (1, 2, 3, 4, 5)
+COUNTER_FIELDS = ('post_count', 'rating_sum') + tuple(f'count_{rating}' for rating in RATINGS)
+
+
+def _scope_rows(author_id):
+    if author_id is None:
+        return RatingAggregate.objects.filter(author__isnull=True)
+    return RatingAggregate.objects.filter(author_id=author_id)
+
+
+def _deltas(changes):
+    """
+    Fold (author_id, old_rating, new_rating) changes into per-scope field deltas.
+
+    old_rating is None for a new post and new_rating is None for a deleted
+    one. Scope None is the global row.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for author_id, old, new in changes:
+        if old == new:
+            continue
+        for scope in (author_id, None):
+            delta = deltas[scope]
+            if old is not None:
+                delta['post_count'] -= 1
+                delta['rating_sum'] -= old
+                delta[f'count_{old}'] -= 1
+            if new is not None:
+                delta['post_count'] += 1
+                delta['rating_sum'] += new
+                delta[f'count_{new}'] += 1
+    return deltas
+
+
+def record_rating_changes(changes):
+    """
+    Apply post rating changes to the aggregates; call inside the post write's transaction.
+
+    Costs one UPDATE per affected row (the author and the global row),
+    plus an INSERT the first time an author is seen.
+    """
+    for scope, delta in _deltas(changes).items():
+        updates = {field: F(field) + value for field, value in delta.items() if value}
+        if not updates:
+            continue
+        rows = _scope_rows(scope)
+        if not rows.update(**updates) and scope is not None:
+            RatingAggregate.objects.bulk_create([RatingAggregate(author_id=scope)], ignore_conflicts=True)
+            rows.update(**updates)
+
+
+def delete_posts(posts):
+    """
+    Delete posts and take exactly the deleted rows out of the aggregates. Returns the number deleted.
+
+    Pass posts locked with select_for_update() in the current transaction.
+    Runs one DELETE per (author, rating), so each count it returns is an
+    exact delta even if a concurrent delete removed some rows first.
+    """
+    groups = defaultdict(list)
+    for post in posts:
+        groups[post.author_id, post.rating].append(post.pk)
+    deleted = 0
+    for (author_id, rating), ids in groups.items():
+        _, counts = Post.objects.filter(id__in=ids, author_id=author_id, rating=rating).delete()
+        count = counts.get(Post._meta.label, 0)
+        record_rating_changes([(author_id, rating, None)] * count)
+        deleted += count
+    return deleted
+
+
+def _counters():
+    return {
+        'post_count': Count('id'),
+        'rating_sum': Sum('rating', default=0),
+        **{f'count_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATINGS},
+    }
+
+
+def compute_aggregates():
+    """Aggregate the posts table from scratch into {author_id or None: {field: value}}."""
+    posts = Post.objects.order_by()
+    expected = {
+        row.pop('author_id'): row
+        for row in posts.values('author_id').annotate(**_counters())
+    }
+    expected[None] = posts.aggregate(**_counters())
+    return expected
+
+
+def stored_aggregates():
+    return {
+        row.pop('author_id'): row
+        for row in RatingAggregate.objects.values('author_id', *COUNTER_FIELDS)
+    }
+
+
+def find_drift():
+    """Return {author_id or None: (stored, expected)} for every row that disagrees with the posts table."""
+    expected = compute_aggregates()
+    stored = stored_aggregates()
+    empty = dict.fromkeys(COUNTER_FIELDS, 0)
+    return {
+        scope: (stored.get(scope, empty), expected.get(scope, empty))
+        for scope in expected.keys() | stored.keys()
+        if stored.get(scope, empty) != expected.get(scope, empty)
+    }
+
+
+def rebuild_aggregates():
+    """Replace every aggregate row with totals recomputed from the posts table. Returns the row count."""
+    with transaction.atomic():
+        expected = compute_aggregates()
+        RatingAggregate.objects.all().delete()
+        RatingAggregate.objects.bulk_create(
+            [RatingAggregate(author_id=scope, **fields) for scope, fields in expected.items()],
+            batch_size=1000,
+        )
+    return len(expected)
+
+
+def rating_stats(author_id=None):
+    """Post count, average rating and histogram for an author or all posts, from one row."""
+    row = _scope_rows(author_id).values(*COUNTER_FIELDS).first() or dict.fromkeys(COUNTER_FIELDS, 0)
+    return {
+        'post_count': row['post_count'],
+        'average_rating': round(row['rating_sum'] / row['post_count'], 2) if row['post_count'] else None,
+        'histogram': {str(rating): row[f'count_{rating}'] for rating in RATINGS},
+    }
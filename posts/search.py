@@ -0,0 +1,100 @@
+import re
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from .models import Post
+
+SEARCH_TABLE = 'posts_post_fts'
+# bm25() weights for the title and description columns
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+SNIPPET_TOKENS = 16
+# Control characters FTS5 wraps around matched terms; they're swapped for
+# <mark> tags only after the post text has been HTML-escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(using=None):
+    """Full-text search needs the FTS5 table, which is only created on SQLite."""
+    return connections[using or router.db_for_read(Post)].vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query that matches every term.
+
+    Terms are quoted so user input can't inject FTS5 syntax; the last one
+    also matches as a prefix for search-as-you-type. Returns '' when the
+    query has no searchable terms.
+    """
+    terms = TERM_RE.findall(query)
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def render_snippet(snippet):
+    """HTML-escape an FTS5 snippet, then mark its matched terms."""
+    return escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def filter_matching(queryset, query):
+    """Narrow a Post queryset to rows matching query, looked up in the FTS5 index."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [expression]
+    ))
+
+
+def search_posts(query, offset=0, limit=20):
+    """
+    Return ([(post, score, snippet)], has_more) for one page of ranked matches.
+
+    Snippets are HTML-escaped post text with matched terms in <mark> tags.
+
+    Lower bm25 scores are better matches. Costs two queries: the ranked
+    FTS5 lookup and a fetch of the matching posts with their authors.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return [], False
+
+    using = router.db_for_read(Post)
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT rowid,
+                   bm25({SEARCH_TABLE}, %s, %s) AS score,
+                   snippet({SEARCH_TABLE}, -1, %s, %s, '…', %s)
+            FROM {SEARCH_TABLE}
+            WHERE {SEARCH_TABLE} MATCH %s
+            ORDER BY score, rowid
+            LIMIT %s OFFSET %s
+            """,
+            [TITLE_WEIGHT, DESCRIPTION_WEIGHT, MATCH_START, MATCH_END, SNIPPET_TOKENS, expression, limit + 1, offset],
+        )
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    posts = Post.objects.using(using).select_related('author').in_bulk([post_id for post_id, _, _ in rows])
+    # A post deleted between the two queries is simply left out
+    return [
+        (posts[post_id], score, render_snippet(snippet)) for post_id, score, snippet in rows if post_id in posts
+    ], has_more
+
+
+def rebuild_search_index(using='default'):
+    """Repopulate the FTS5 index from posts_post and merge its segments."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from .models import RatingAggregate
+from .ratings import COUNTER_FIELDS
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def remove_author_ratings(sender, instance, **kwargs):
+    """Take a deleted author's cascaded posts out of the global rating totals."""
+    row = RatingAggregate.objects.filter(author=instance).values(*COUNTER_FIELDS).first()
+    if row and row['post_count']:
+        RatingAggregate.objects.filter(author__isnull=True).update(
+            **{field: F(field) - value for field, value in row.items() if value}
+        )
@@ -1,3 +1,577 @@
-from django.test import TestCase
+import base64
+import json
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.urls import path
+from accounts.jwt_utils import generate_token
+from accounts.models import User
+from accounts.redis_utils import redis_client
+from myproject.pagination import _page_queryset
+from wallet.balance_cache import evict_wallet
+from wallet.models import Wallet
+from wallet import views as wallet_views
+from .cache import CACHE_PREFIX, LOCK_PREFIX, acached_json, cached_json, get_generation
+from .models import Post
+from .ratings import find_drift, rebuild_aggregates
+from . import views
 
-# Create your tests here.
+AUTHORS = 20
+POSTS = 2000
+
+
+def make_user(email):
+    return User.objects.create_user(
+        email=email,
+        password=None,
+        first_name='Test',
+        last_name='User',
+        dob=date(1990, 1, 1),
+        user_type='editor',
+    )
+
+
+def seed_posts():
+    authors = [make_user(f'author{i}@example.com') for i in range(AUTHORS)]
+    Post.objects.bulk_create(
+        Post(title=f'Post {i}', description='Lorem ipsum ' * 20, rating=i % 5 + 1, author=authors[i % AUTHORS])
+        for i in range(POSTS)
+    )
+    rebuild_aggregates()
+    return authors
+
+
+@override_settings(POSTS_CACHE_ENABLED=False)
+class PostQueryCountTests(TestCase):
+    """Each endpoint must issue a fixed number of queries, however large the table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = seed_posts()
+        cls.user = cls.authors[0]
+        Wallet.objects.filter(user=cls.user).update(balance=Decimal('100.00'))
+        cls.own_post = Post.objects.filter(author=cls.user).first()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Redis outlives each test's rollback; start from a cold wallet cache
+        evict_wallet(self.user.id)
+
+    def call(self, view, method, path, body=None, **kwargs):
+        if body is None:
+            request = getattr(self.factory, method)(path)
+        else:
+            request = getattr(self.factory, method)(path, json.dumps(body), content_type='application/json')
+        request.user = self.user
+        return view(request, **kwargs)
+
+    def test_list_posts(self):
+        with self.assertNumQueries(1):
+            response = self.call(views.get_all_posts, 'get', '/posts/?limit=50')
+        data = json.loads(response.content)
+        self.assertEqual(len(data['posts']), 50)
+        # Authors come from the join, not one query per post
+        self.assertEqual(len({post['author']['id'] for post in data['posts']}), AUTHORS)
+
+    def test_list_posts_deep_page(self):
+        cursor = None
+        for _ in range(5):
+            path = f'/posts/?limit=100&cursor={cursor}' if cursor else '/posts/?limit=100'
+            with self.assertNumQueries(1):
+                response = self.call(views.get_all_posts, 'get', path)
+            cursor = json.loads(response.content)['next']
+        self.assertIsNotNone(cursor)
+
+    def test_get_post(self):
+        with self.assertNumQueries(1):
+            response = self.call(views.get_post, 'get', '/posts/1/', post_id=self.own_post.id)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_posts(self):
+        with self.assertNumQueries(1):
+            response = self.call(views.export_posts, 'get', '/posts/export/')
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), POSTS)
+
+    @override_settings(POSTS_EXPORT_CHUNK_SIZE=500)
+    def test_export_posts_streams_chunks(self):
+        response = self.call(views.export_posts, 'get', '/posts/export/')
+        chunks = list(response.streaming_content)
+        # One chunk per batch of rows, not a single buffered body
+        self.assertEqual(len(chunks), POSTS // 500)
+        self.assertEqual(len(b''.join(chunks).splitlines()), POSTS)
+
+    def test_export_posts_json(self):
+        response = self.call(views.export_posts, 'get', '/posts/export/?format=json')
+        posts = json.loads(b''.join(response.streaming_content))['posts']
+        self.assertEqual(len(posts), POSTS)
+        self.assertEqual(posts[0]['author']['id'], Post.objects.order_by('id').first().author_id)
+        Post.objects.all().delete()
+        response = self.call(views.export_posts, 'get', '/posts/export/?format=json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'posts': []})
+
+    def test_create_post(self):
+        body = {'title': 'New', 'description': 'Body', 'rating': 4}
+        Wallet.objects.for_user(self.user.id)
+        # debit, ledger row, balance refresh, post insert, author and global
+        # rating rows, and two savepoints; the wallet comes from the cache
+        with self.assertNumQueries(10):
+            response = self.call(views.create_post, 'post', '/posts/create/', body)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(find_drift(), {})
+
+    def test_edit_post(self):
+        with self.assertNumQueries(6):
+            response = self.call(views.edit_post, 'patch', '/posts/1/edit/', {'rating': 2}, post_id=self.own_post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(find_drift(), {})
+
+    def test_delete_post(self):
+        with self.assertNumQueries(6):
+            response = self.call(views.delete_post, 'delete', '/posts/1/delete/', post_id=self.own_post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(find_drift(), {})
+
+    def test_batch_create_posts(self):
+        Wallet.objects.for_user(self.user.id)
+        for size in (1, 50):
+            body = {'posts': [{'title': f'New {i}', 'description': 'Body', 'rating': 4} for i in range(size)]}
+            # Same as a single create: one debit, one ledger row and one insert for the batch
+            with self.assertNumQueries(10):
+                response = self.call(views.batch_create_posts, 'post', '/posts/batch/create/', body)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(json.loads(response.content)['posts']), size)
+        self.assertEqual(self.user.wallet.transactions.count(), 2)
+        self.assertEqual(find_drift(), {})
+
+    def test_batch_edit_posts(self):
+        ids = list(Post.objects.filter(author=self.user).values_list('id', flat=True)[:50])
+        body = {'posts': [{'id': post_id, 'rating': 5} for post_id in ids]}
+        with self.assertNumQueries(6):
+            response = self.call(views.batch_edit_posts, 'patch', '/posts/batch/edit/', body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.filter(id__in=ids, rating=5).count(), len(ids))
+        self.assertEqual(find_drift(), {})
+
+    def test_batch_delete_posts(self):
+        ids = list(Post.objects.filter(author=self.user).values_list('id', flat=True)[:50])
+        with self.assertNumQueries(6):
+            response = self.call(views.batch_delete_posts, 'delete', '/posts/batch/delete/', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.filter(id__in=ids).exists())
+        self.assertEqual(find_drift(), {})
+
+    def test_batch_delete_mixed_ratings(self):
+        ids = list(Post.objects.filter(author=self.user).values_list('id', flat=True)[:6])
+        for rating, post_id in enumerate(ids[:4], start=2):
+            Post.objects.filter(id=post_id).update(rating=rating)
+        rebuild_aggregates()
+        response = self.call(views.batch_delete_posts, 'delete', '/posts/batch/delete/', {'ids': ids})
+        self.assertEqual(json.loads(response.content)['deleted'], len(ids))
+        self.assertEqual(find_drift(), {})
+
+    def test_rating_stats(self):
+        request = self.factory.get('/posts/stats/', {'author': self.user.id})
+        request.user = self.user
+        with self.assertNumQueries(1):
+            data = json.loads(views.get_rating_stats(request).content)
+        self.assertEqual(data['post_count'], POSTS // AUTHORS)
+        self.assertEqual(data['histogram'], {'1': POSTS // AUTHORS, '2': 0, '3': 0, '4': 0, '5': 0})
+
+    def test_deleting_author_updates_global_stats(self):
+        self.authors[1].delete()
+        self.assertEqual(find_drift(), {})
+
+    def test_batch_rejects_foreign_posts(self):
+        foreign = Post.objects.exclude(author=self.user).first()
+        response = self.call(views.batch_delete_posts, 'delete', '/posts/batch/delete/', {'ids': [self.own_post.id, foreign.id]})
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Post.objects.filter(id=self.own_post.id).exists())
+
+
+class PostCacheTests(SimpleTestCase):
+    """cached_json stores successful responses only and never strands waiters behind a lock."""
+
+    def setUp(self):
+        # Keys live in the shared Redis, so each test works under its own name
+        self.name = f'test:{uuid.uuid4().hex}'
+        self.builds = 0
+
+    def tearDown(self):
+        redis_client.delete(self.key(), self.lock_key())
+
+    def key(self):
+        return f'{CACHE_PREFIX}{get_generation()}:{self.name}'
+
+    def lock_key(self):
+        return f'{LOCK_PREFIX}{self.key()}'
+
+    def build(self, status=200):
+        self.builds += 1
+        return status, b'{"n":%d}' % self.builds
+
+    @staticmethod
+    def parsed(result):
+        status, body = result
+        return status, json.loads(body)
+
+    def test_hit_skips_build(self):
+        self.assertEqual(self.parsed(cached_json(self.name, self.build)), (200, {'n': 1}))
+        self.assertEqual(self.parsed(cached_json(self.name, self.build)), (200, {'n': 1}))
+        self.assertEqual(self.builds, 1)
+        self.assertFalse(redis_client.exists(self.lock_key()))
+
+    def test_errors_not_cached(self):
+        self.assertEqual(cached_json(self.name, lambda: self.build(404))[0], 404)
+        self.assertEqual(cached_json(self.name, lambda: self.build(404))[0], 404)
+        self.assertEqual(self.builds, 2)
+        self.assertFalse(redis_client.exists(self.key()))
+
+    def test_lock_released_when_build_fails(self):
+        def failing():
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            cached_json(self.name, failing)
+        self.assertFalse(redis_client.exists(self.lock_key()))
+
+    @override_settings(POSTS_CACHE_WAIT=0.05)
+    def test_waiter_gives_up_quickly(self):
+        redis_client.set(self.lock_key(), 'someone-else', ex=5)
+        started = time.monotonic()
+        self.assertEqual(self.parsed(cached_json(self.name, self.build)), (200, {'n': 1}))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_waiter_uses_result_of_builder(self):
+        redis_client.set(self.lock_key(), 'someone-else', ex=5)
+        redis_client.set(self.key(), b'200:{"built":"elsewhere"}', ex=5)
+        self.assertEqual(self.parsed(cached_json(self.name, self.build)), (200, {'built': 'elsewhere'}))
+        self.assertEqual(self.builds, 0)
+
+    async def test_async_matches_sync(self):
+        async def build(status=200):
+            return self.build(status)
+
+        self.assertEqual(self.parsed(await acached_json(self.name, build)), (200, {'n': 1}))
+        self.assertEqual(self.parsed(await acached_json(self.name, build)), (200, {'n': 1}))
+        self.assertEqual(self.builds, 1)
+
+
+def raw_cursor(payload):
+    """A cursor with arbitrary JSON in it, as a client could forge one."""
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+class PostListCursorTests(TestCase):
+    """Keyset pages cover every post exactly once, in both directions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('cursor@example.com')
+        posts = Post.objects.bulk_create(
+            Post(title=f'Post {i}', description='Body', rating=3, author=cls.user) for i in range(25)
+        )
+        start = timezone.now()
+        for i, post in enumerate(posts):
+            # Posts 5-14 share a timestamp, so only the id orders them, across page boundaries
+            Post.objects.filter(pk=post.pk).update(created_at=start + timedelta(seconds=min(max(i, 5), 14)))
+
+    def page(self, cursor=None, limit=7):
+        params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+        request = RequestFactory().get('/posts/', params)
+        request.user = self.user
+        with self.settings(POSTS_CACHE_ENABLED=False):
+            response = views.get_all_posts(request)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    @staticmethod
+    def ids(page):
+        return [post['id'] for post in page['posts']]
+
+    def test_pages_cover_every_post_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page = self.page(cursor)
+            seen += self.ids(page)
+            cursor = page['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_next_then_prev_round_trip(self):
+        pages = [self.page()]
+        while pages[-1]['next']:
+            pages.append(self.page(pages[-1]['next']))
+        self.assertIsNone(pages[0]['prev'])
+        for previous, page in zip(pages, pages[1:]):
+            back = self.page(page['prev'])
+            self.assertEqual(self.ids(back), self.ids(previous))
+            self.assertEqual(self.ids(self.page(back['next'])), self.ids(page))
+
+    def test_invalid_cursor_rejected_before_caching(self):
+        request = RequestFactory().get('/posts/', {'cursor': 'not-a-cursor'})
+        request.user = self.user
+        response = views.get_all_posts(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(redis_client.scan_iter(f'{CACHE_PREFIX}*not-a-cursor*')), [])
+
+    def test_malformed_cursors(self):
+        for payload in (
+            '{"c":"2024-01-01T00:00:00","i":1e999,"d":"next"}',
+            '{"c":"2024-01-01T00:00:00","i":9223372036854775808,"d":"next"}',
+            '{"c":"2024-01-01T00:00:00","i":1,"d":"sideways"}',
+            '{"c":"yesterday","i":1,"d":"next"}',
+            '[]',
+        ):
+            request = RequestFactory().get('/posts/', {'cursor': raw_cursor(payload)})
+            request.user = self.user
+            self.assertEqual(views.get_all_posts(request).status_code, 400, payload)
+
+
+# The exports as routed with ASYNC_VIEWS=True, for AsyncExportTests
+urlpatterns = [
+    path('posts/export/', views.aexport_posts),
+    path('wallet/transactions/export/', wallet_views.aexport_transactions),
+]
+
+
+@override_settings(ROOT_URLCONF='posts.tests', POSTS_EXPORT_CHUNK_SIZE=500)
+class AsyncExportTests(TestCase):
+    """Under ASGI the exports stream chunk by chunk instead of being buffered first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = seed_posts()
+        cls.token = generate_token(cls.authors[0])
+
+    async def get(self, path):
+        response = await self.async_client.get(path, headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        return aiter(response.streaming_content)
+
+    async def test_posts_export(self):
+        chunks = await self.get('/posts/export/')
+        self.assertEqual(len((await anext(chunks)).splitlines()), 500)
+        self.assertEqual(len([chunk async for chunk in chunks]), POSTS // 500 - 1)
+
+    async def test_transactions_export(self):
+        chunks = await self.get('/wallet/transactions/export/')
+        self.assertTrue((await anext(chunks)).startswith(b'id,created_at'))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class PostQueryPlanTests(TestCase):
+    """Hot queries must be served from an index, never a full scan or a sort."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = seed_posts()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_first_page(self):
+        queryset, _ = _page_queryset(Post.objects.select_related('author'), None, 20)
+        self.assertUsesIndex(queryset, 'post_created_at_id_idx')
+
+    def test_cursor_pages_seek(self):
+        first = views.keyset_paginate(Post.objects.all(), limit=20)
+        for cursor in first[1], views.keyset_paginate(Post.objects.all(), first[1], 20)[2]:
+            queryset, _ = _page_queryset(Post.objects.select_related('author'), cursor, 20)
+            plan = queryset.explain()
+            self.assertRegex(plan, r'SEARCH posts_post USING INDEX post_created_at_id_idx \(created_at[<>]\?\)')
+            self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_posts_by_author(self):
+        queryset = Post.objects.filter(author=self.authors[0]).order_by('-created_at')[:20]
+        self.assertUsesIndex(queryset, 'post_author_created_at_idx')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Full-text search uses SQLite FTS5')
+@override_settings(POSTS_CACHE_ENABLED=False)
+class PostSearchTests(TestCase):
+    """The FTS5 index follows every write and ranks title matches first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('searcher@example.com')
+        Wallet.objects.filter(user=cls.user).update(balance=Decimal('100.00'))
+        cls.in_title = Post.objects.create(title='Sourdough starter', description='Flour and water', rating=5, author=cls.user)
+        cls.in_body = Post.objects.create(title='Weekend', description='Fed the sourdough again', rating=3, author=cls.user)
+        Post.objects.create(title='Unrelated', description='Nothing to see', rating=1, author=cls.user)
+
+    def search(self, query, **params):
+        request = RequestFactory().get('/posts/search/', {'q': query, **params})
+        request.user = self.user
+        return json.loads(views.search(request).content)
+
+    def test_ranked_with_snippets(self):
+        with self.assertNumQueries(2):
+            data = self.search('sourdough')
+        self.assertEqual([post['id'] for post in data['results']], [self.in_title.id, self.in_body.id])
+        self.assertIn('<mark>sourdough</mark>', data['results'][1]['snippet'])
+
+    def test_index_follows_bulk_writes(self):
+        Post.objects.filter(pk=self.in_body.pk).update(description='Baked a rye loaf')
+        Post.objects.filter(pk=self.in_title.pk).delete()
+        self.assertEqual(self.search('sourdough')['results'], [])
+        self.assertEqual(len(self.search('rye')['results']), 1)
+
+    def test_pagination_and_syntax_safety(self):
+        first = self.search('sourd', limit=1)
+        self.assertEqual(len(first['results']), 1)
+        second = self.search('sourd', limit=1, cursor=first['next'])
+        self.assertEqual(second['results'][0]['id'], self.in_body.id)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.search('"unbalanced AND (')['results'], [])
+
+    def test_offset_cursor_bounds(self):
+        for payload in ('{"o":1e999}', '{"o":-1}', '{"o":100000}'):
+            request = RequestFactory().get('/posts/search/', {'q': 'sourd', 'cursor': raw_cursor(payload)})
+            request.user = self.user
+            self.assertEqual(views.search(request).status_code, 400, payload)
+        with self.settings(POSTS_SEARCH_MAX_OFFSET=1):
+            first = self.search('sourd', limit=1)
+            self.assertIsNotNone(first['next'])
+            self.assertIsNone(self.search('sourd', limit=1, cursor=first['next'])['next'])
+
+    def test_snippet_is_escaped(self):
+        Post.objects.create(title='<script>alert(1)</script> crumb', description='Crust', rating=2, author=self.user)
+        snippet = self.search('crumb')['results'][0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>crumb</mark>', snippet)
+
+
+ADMIN_POSTS = 1_000_000
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Seeds with a SQLite recursive CTE and searches through FTS5')
+class PostAdminTests(TestCase):
+    """The post changelist never counts, scans or DISTINCTs the whole table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', first_name='Ada', last_name='Admin', dob=date(1990, 1, 1), user_type='editor'
+        )
+        cls.authors = seed_posts()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO posts_post (title, description, rating, author_id, created_at, updated_at)
+                WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < %s)
+                SELECT 'Bulk ' || x, 'Filler', x %% 5 + 1, %s, datetime('2024-01-01', '+' || x || ' seconds'),
+                       datetime('2024-01-01', '+' || x || ' seconds') FROM n
+                """,
+                [ADMIN_POSTS - POSTS, cls.authors[0].id],
+            )
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, params=None):
+        # session, user, count, page
+        with self.assertNumQueries(4) as queries:
+            response = self.client.get('/admin/posts/post/', params)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+            if 'COUNT(' in query['sql']:
+                self.assertIn('LIMIT', query['sql'])
+        self.response = response
+        return response.context['cl']
+
+    def test_unfiltered_count_is_estimated(self):
+        self.assertEqual(self.changelist().result_count, ADMIN_POSTS)
+
+    def test_rating_filter(self):
+        changelist = self.changelist({'rating': '3'})
+        self.assertEqual(changelist.result_count, 10000)
+        self.assertContains(self.response, '10000+ posts')
+        self.assertTrue(all(post.rating == 3 for post in changelist.result_list))
+
+    def test_pages_past_count_limit(self):
+        # The count stops at the limit, but the page after it is linked
+        self.assertEqual(self.changelist({'rating': '3'}).paginator.num_pages, 101)
+        changelist = self.changelist({'rating': '3', 'p': '101'})
+        self.assertEqual(len(changelist.result_list), 100)
+        self.assertEqual(changelist.result_count, 10100)
+        self.assertEqual(changelist.paginator.num_pages, 102)
+
+    def test_search_uses_fts(self):
+        changelist = self.changelist({'q': 'Post 17'})
+        # "17" matches as a prefix: 17, 170-179 and 1700-1799
+        self.assertEqual(changelist.result_count, 111)
+        self.assertIn(' MATCH ', str(changelist.queryset.query))
+
+    def test_author_autocomplete(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/autocomplete/', {
+                'app_label': 'posts', 'model_name': 'post', 'field_name': 'author', 'term': 'author1',
+            })
+        self.assertEqual(len(json.loads(response.content)['results']), 11)
+
+
+@override_settings(POSTS_CACHE_ENABLED=True)
+class PostAdminWriteTests(TestCase):
+    """Admin saves and deletes keep the rating aggregates and the cache generation in step."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', first_name='Ada', last_name='Admin', dob=date(1990, 1, 1), user_type='editor'
+        )
+        cls.author = make_user('writer@example.com')
+        cls.posts = Post.objects.bulk_create(
+            Post(title=f'Post {i}', description='Body', rating=i % 5 + 1, author=cls.author) for i in range(5)
+        )
+        rebuild_aggregates()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assertSynced(self, method, url, data, status=302):
+        generation = get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(find_drift(), {})
+        self.assertNotEqual(get_generation(), generation)
+
+    def test_add(self):
+        self.assertSynced('post', '/admin/posts/post/add/', {
+            'title': 'New', 'description': 'Body', 'rating': 4, 'author': self.author.id,
+        })
+        self.assertTrue(Post.objects.filter(title='New').exists())
+
+    def test_change_rating_and_author(self):
+        post = self.posts[0]
+        self.assertSynced('post', f'/admin/posts/post/{post.id}/change/', {
+            'title': post.title, 'description': post.description, 'rating': 5, 'author': self.admin.id,
+        })
+        post.refresh_from_db()
+        self.assertEqual((post.rating, post.author_id), (5, self.admin.id))
+
+    def test_delete(self):
+        self.assertSynced('post', f'/admin/posts/post/{self.posts[0].id}/delete/', {'post': 'yes'})
+        self.assertEqual(Post.objects.count(), 4)
+
+    def test_delete_selected(self):
+        self.assertSynced('post', '/admin/posts/post/', {
+            'action': 'delete_selected', '_selected_action': [post.id for post in self.posts[:3]], 'post': 'yes',
+        })
+        self.assertEqual(Post.objects.count(), 2)
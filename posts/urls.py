@@ -1,10 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('', views.get_all_posts, name='get_all_posts'),
+    path('', views.aget_all_posts if settings.ASYNC_VIEWS else views.get_all_posts, name='get_all_posts'),
+    path('export/', views.aexport_posts if settings.ASYNC_VIEWS else views.export_posts, name='export_posts'),
+    path('search/', views.search, name='search_posts'),
+    path('stats/', views.get_rating_stats, name='get_rating_stats'),
     path('create/', views.create_post, name='create_post'),
-    path('<int:post_id>/', views.get_post, name='get_post'),
+    path('batch/create/', views.batch_create_posts, name='batch_create_posts'),
+    path('batch/edit/', views.batch_edit_posts, name='batch_edit_posts'),
+    path('batch/delete/', views.batch_delete_posts, name='batch_delete_posts'),
+    path('<int:post_id>/', views.aget_post if settings.ASYNC_VIEWS else views.get_post, name='get_post'),
     path('<int:post_id>/edit/', views.edit_post, name='edit_post'),
     path('<int:post_id>/delete/', views.delete_post, name='delete_post'),
 ]
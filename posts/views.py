@@ -1,11 +1,21 @@
 import json
 from decimal import Decimal
 from django.conf import settings
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
+from myproject.responses import JsonResponse, aiter_chunks, dumps
+from myproject.pagination import (
+    InvalidCursor, akeyset_paginate, decode_offset_cursor, encode_offset_cursor, keyset_paginate,
+    normalize_cursor, parse_limit,
+)
+from .cache import acached_json, bump_generation, cached_json
 from .models import Post
-from wallet.models import Wallet
+from .ratings import delete_posts, rating_stats, record_rating_changes
+from .search import is_supported as search_supported, search_posts
+from wallet.models import InsufficientFunds, Wallet
 
 
 def get_author_data(user):
@@ -26,8 +36,8 @@ def post_to_dict(post):
         'description': post.description,
         'rating': post.rating,
         'author': get_author_data(post.author),
-        'created_at': post.created_at.isoformat(),
-        'updated_at': post.updated_at.isoformat(),
+        'created_at': post.created_at,
+        'updated_at': post.updated_at,
     }
 
 
@@ -37,9 +47,196 @@ def get_all_posts(request):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
-    posts = Post.objects.select_related('author').order_by('-created_at')
+    try:
+        limit = parse_limit(request.GET.get('limit'), settings.POSTS_PAGE_SIZE, settings.POSTS_MAX_PAGE_SIZE)
+        # Validated before it becomes part of the cache key
+        cursor = normalize_cursor(request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    status, body = cached_json(f'list:{limit}:{cursor}', lambda: build_posts_page(cursor, limit))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+def build_posts_page(cursor, limit):
+    """Render one page of the posts listing as (status, json_body)."""
+    try:
+        posts, next_cursor, prev_cursor = keyset_paginate(
+            Post.objects.select_related('author'),
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursor as e:
+        return 400, dumps({'error': str(e)})
+
+    data = [post_to_dict(post) for post in posts]
+    return 200, dumps({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+
+
+@require_http_methods(["GET"])
+async def aget_all_posts(request):
+    """Async version of get_all_posts for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        limit = parse_limit(request.GET.get('limit'), settings.POSTS_PAGE_SIZE, settings.POSTS_MAX_PAGE_SIZE)
+        # Validated before it becomes part of the cache key
+        cursor = normalize_cursor(request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    status, body = await acached_json(f'list:{limit}:{cursor}', lambda: abuild_posts_page(cursor, limit))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+async def abuild_posts_page(cursor, limit):
+    """Async version of build_posts_page."""
+    try:
+        posts, next_cursor, prev_cursor = await akeyset_paginate(
+            Post.objects.select_related('author'),
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursor as e:
+        return 400, dumps({'error': str(e)})
+
     data = [post_to_dict(post) for post in posts]
-    return JsonResponse({'posts': data})
+    return 200, dumps({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+
+
+EXPORT_FIELDS = (
+    'id', 'title', 'description', 'rating', 'created_at', 'updated_at',
+    'author__id', 'author__email', 'author__first_name', 'author__last_name',
+)
+
+
+def post_values_to_dict(row):
+    """Helper to convert a .values() row to the same shape as post_to_dict."""
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'rating': row['rating'],
+        'author': {
+            'id': row['author__id'],
+            'email': row['author__email'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+        },
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+    }
+
+
+def batched(items, size):
+    """Group an iterable into lists of at most `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_posts(fmt, chunk_size):
+    """Yield the whole posts table as NDJSON lines or a JSON document, one chunk at a time."""
+    rows = Post.objects.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    lines = (dumps(post_values_to_dict(row)) for row in rows)
+
+    if fmt == 'ndjson':
+        for batch in batched(lines, chunk_size):
+            yield b'\n'.join(batch) + b'\n'
+        return
+
+    yield b'{"posts":['
+    for i, batch in enumerate(batched(lines, chunk_size)):
+        yield (b',' if i else b'') + b','.join(batch)
+    yield b']}'
+
+
+@require_http_methods(["GET"])
+def export_posts(request):
+    """Stream every post without materializing the table in memory."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return JsonResponse({'error': 'format must be "ndjson" or "json"'}, status=400)
+
+    content_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return StreamingHttpResponse(
+        stream_posts(fmt, settings.POSTS_EXPORT_CHUNK_SIZE),
+        content_type=content_type,
+    )
+
+
+@require_http_methods(["GET"])
+async def aexport_posts(request):
+    """Async version of export_posts for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return JsonResponse({'error': 'format must be "ndjson" or "json"'}, status=400)
+
+    content_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return StreamingHttpResponse(
+        aiter_chunks(stream_posts(fmt, settings.POSTS_EXPORT_CHUNK_SIZE)),
+        content_type=content_type,
+    )
+
+
+@require_http_methods(["GET"])
+def search(request):
+    """Ranked full-text search over post titles and descriptions."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    if not search_supported():
+        return JsonResponse({'error': 'Search is not available on this database'}, status=501)
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+
+    try:
+        limit = parse_limit(request.GET.get('limit'), settings.POSTS_PAGE_SIZE, settings.POSTS_MAX_PAGE_SIZE)
+        max_offset = settings.POSTS_SEARCH_MAX_OFFSET
+        offset = decode_offset_cursor(request.GET['cursor'], max_offset) if request.GET.get('cursor') else 0
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    results, has_more = search_posts(query, offset=offset, limit=limit)
+    return JsonResponse({
+        'results': [
+            {**post_to_dict(post), 'score': round(score, 4), 'snippet': snippet}
+            for post, score, snippet in results
+        ],
+        # Ranked results are paged by OFFSET, so depth is capped rather than unbounded
+        'next': encode_offset_cursor(offset + limit) if has_more and offset + limit <= max_offset else None,
+        'prev': encode_offset_cursor(max(0, offset - limit)) if offset else None,
+    })
+
+
+@require_http_methods(["GET"])
+def get_rating_stats(request):
+    """Rating count, average and histogram for all posts, or one author with ?author=<id>."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    author_id = request.GET.get('author')
+    if author_id is not None:
+        try:
+            author_id = int(author_id)
+        except ValueError:
+            return JsonResponse({'error': 'author must be an integer'}, status=400)
+
+    return JsonResponse({'author': author_id, **rating_stats(author_id)})
 
 
 @require_http_methods(["GET"])
@@ -48,11 +245,36 @@ def get_post(request, post_id):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
+    status, body = cached_json(f'detail:{post_id}', lambda: build_post_detail(post_id))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+def build_post_detail(post_id):
+    """Render a single post as (status, json_body)."""
     try:
         post = Post.objects.select_related('author').get(id=post_id)
-        return JsonResponse(post_to_dict(post))
+        return 200, dumps(post_to_dict(post))
     except Post.DoesNotExist:
-        return JsonResponse({'error': 'Post not found'}, status=404)
+        return 404, dumps({'error': 'Post not found'})
+
+
+@require_http_methods(["GET"])
+async def aget_post(request, post_id):
+    """Async version of get_post for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    status, body = await acached_json(f'detail:{post_id}', lambda: abuild_post_detail(post_id))
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+async def abuild_post_detail(post_id):
+    """Async version of build_post_detail."""
+    try:
+        post = await Post.objects.select_related('author').aget(id=post_id)
+        return 200, dumps(post_to_dict(post))
+    except Post.DoesNotExist:
+        return 404, dumps({'error': 'Post not found'})
 
 
 @csrf_exempt
@@ -74,26 +296,28 @@ def create_post(request):
         if not isinstance(rating, int) or rating < 1 or rating > 5:
             return JsonResponse({'error': 'rating must be an integer between 1 and 5'}, status=400)
 
-        # Check wallet balance and deduct post creation fee
+        # Deduct the post creation fee; the debit only succeeds if the balance covers it
         post_cost = Decimal(settings.POST_CREATION_COST)
-        wallet, _ = Wallet.objects.get_or_create(user=request.user)
+        wallet = Wallet.objects.for_user(request.user.id)
 
-        if not wallet.has_sufficient_funds(post_cost):
+        try:
+            with transaction.atomic():
+                wallet.withdraw(post_cost, description='Post creation fee')
+                post = Post.objects.create(
+                    title=title,
+                    description=description,
+                    rating=rating,
+                    author=request.user
+                )
+                record_rating_changes([(request.user.id, None, rating)])
+        except InsufficientFunds:
             return JsonResponse({
                 'error': 'Insufficient funds',
-                'required': str(post_cost),
-                'balance': str(wallet.balance)
+                'required': post_cost,
+                'balance': wallet.balance
             }, status=402)
 
-        # Deduct the fee
-        wallet.withdraw(post_cost, description='Post creation fee')
-
-        post = Post.objects.create(
-            title=title,
-            description=description,
-            rating=rating,
-            author=request.user
-        )
+        transaction.on_commit(bump_generation)
         return JsonResponse(post_to_dict(post), status=201)
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
@@ -107,25 +331,33 @@ def edit_post(request, post_id):
         return JsonResponse({'error': 'Authentication required'}, status=401)
 
     try:
-        post = Post.objects.select_related('author').get(id=post_id)
+        with transaction.atomic():
+            # Locked so the aggregate delta starts from the rating this
+            # write actually replaces, not one a concurrent edit overwrote
+            post = Post.objects.select_for_update(of=('self',)).select_related('author').get(id=post_id)
 
-        # Check if user is the author
-        if post.author_id != request.user.id:
-            return JsonResponse({'error': 'You can only edit your own posts'}, status=403)
+            # Check if user is the author
+            if post.author_id != request.user.id:
+                return JsonResponse({'error': 'You can only edit your own posts'}, status=403)
 
-        data = json.loads(request.body)
+            data = json.loads(request.body)
+            if 'rating' in data:
+                rating = data['rating']
+                if not isinstance(rating, int) or rating < 1 or rating > 5:
+                    return JsonResponse({'error': 'rating must be an integer between 1 and 5'}, status=400)
 
-        if 'title' in data:
-            post.title = data['title']
-        if 'description' in data:
-            post.description = data['description']
-        if 'rating' in data:
-            rating = data['rating']
-            if not isinstance(rating, int) or rating < 1 or rating > 5:
-                return JsonResponse({'error': 'rating must be an integer between 1 and 5'}, status=400)
-            post.rating = rating
+            old_rating = post.rating
+            fields = ['updated_at']
+            for field in ('title', 'description', 'rating'):
+                if field in data:
+                    setattr(post, field, data[field])
+                    fields.append(field)
 
-        post.save()
+            # Only the columns this request changed, so concurrent edits of
+            # different fields don't overwrite each other
+            post.save(update_fields=fields)
+            record_rating_changes([(post.author_id, old_rating, post.rating)])
+        transaction.on_commit(bump_generation)
         return JsonResponse(post_to_dict(post))
     except Post.DoesNotExist:
         return JsonResponse({'error': 'Post not found'}, status=404)
@@ -141,13 +373,166 @@ def delete_post(request, post_id):
         return JsonResponse({'error': 'Authentication required'}, status=401)
 
     try:
-        post = Post.objects.get(id=post_id)
+        with transaction.atomic():
+            post = Post.objects.select_for_update().get(id=post_id)
 
-        # Check if user is the author
-        if post.author_id != request.user.id:
-            return JsonResponse({'error': 'You can only delete your own posts'}, status=403)
+            # Check if user is the author
+            if post.author_id != request.user.id:
+                return JsonResponse({'error': 'You can only delete your own posts'}, status=403)
 
-        post.delete()
+            delete_posts([post])
+        transaction.on_commit(bump_generation)
         return JsonResponse({'message': 'Post deleted successfully'})
     except Post.DoesNotExist:
         return JsonResponse({'error': 'Post not found'}, status=404)
+
+
+def parse_batch(request, key):
+    """Read a JSON body of the form {key: [...]}, enforcing POST_BATCH_MAX_SIZE."""
+    data = json.loads(request.body)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(items) > settings.POST_BATCH_MAX_SIZE:
+        raise ValueError(f'At most {settings.POST_BATCH_MAX_SIZE} {key} per request')
+    return items
+
+
+def load_own_posts(user, ids, action):
+    """
+    Fetch and lock posts by id, returning (posts_by_id, error_response).
+
+    Call it inside the transaction that writes the posts, so rating deltas
+    are computed from the rows the write actually changes.
+    """
+    if not all(isinstance(post_id, int) for post_id in ids):
+        return None, JsonResponse({'error': 'ids must be integers'}, status=400)
+    if len(set(ids)) != len(ids):
+        return None, JsonResponse({'error': 'ids must be unique'}, status=400)
+
+    posts = {
+        post.id: post
+        for post in Post.objects.select_for_update(of=('self',)).select_related('author').filter(id__in=ids)
+    }
+    missing = [post_id for post_id in ids if post_id not in posts]
+    if missing:
+        return None, JsonResponse({'error': 'Post not found', 'ids': missing}, status=404)
+    foreign = [post_id for post_id in ids if posts[post_id].author_id != user.id]
+    if foreign:
+        return None, JsonResponse({'error': f'You can only {action} your own posts', 'ids': foreign}, status=403)
+    return posts, None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def batch_create_posts(request):
+    # Check if user is authenticated
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        items = parse_batch(request, 'posts')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    posts = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not all([item.get('title'), item.get('description'), item.get('rating')]):
+            return JsonResponse({'error': 'title, description, and rating are required', 'index': index}, status=400)
+        rating = item['rating']
+        if not isinstance(rating, int) or rating < 1 or rating > 5:
+            return JsonResponse({'error': 'rating must be an integer between 1 and 5', 'index': index}, status=400)
+        posts.append(Post(title=item['title'], description=item['description'], rating=rating, author=request.user))
+
+    # One debit and one ledger row for the whole batch
+    total_cost = Decimal(settings.POST_CREATION_COST) * len(posts)
+    wallet = Wallet.objects.for_user(request.user.id)
+
+    try:
+        with transaction.atomic():
+            wallet.withdraw(total_cost, description=f'Post creation fee ({len(posts)} posts)')
+            posts = Post.objects.bulk_create(posts)
+            record_rating_changes([(request.user.id, None, post.rating) for post in posts])
+    except InsufficientFunds:
+        return JsonResponse({
+            'error': 'Insufficient funds',
+            'required': total_cost,
+            'balance': wallet.balance
+        }, status=402)
+
+    transaction.on_commit(bump_generation)
+    return JsonResponse({'posts': [post_to_dict(post) for post in posts]}, status=201)
+
+
+@csrf_exempt
+@require_http_methods(["PUT", "PATCH"])
+def batch_edit_posts(request):
+    # Check if user is authenticated
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        items = parse_batch(request, 'posts')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or 'id' not in item:
+            return JsonResponse({'error': 'Each post needs an id', 'index': index}, status=400)
+        if 'rating' in item:
+            rating = item['rating']
+            if not isinstance(rating, int) or rating < 1 or rating > 5:
+                return JsonResponse({'error': 'rating must be an integer between 1 and 5', 'index': index}, status=400)
+
+    ids = [item['id'] for item in items]
+    now = timezone.now()
+    fields = {'updated_at'}
+    with transaction.atomic():
+        posts, error = load_own_posts(request.user, ids, 'edit')
+        if error:
+            return error
+
+        old_ratings = {post_id: post.rating for post_id, post in posts.items()}
+        for item in items:
+            post = posts[item['id']]
+            for field in ('title', 'description', 'rating'):
+                if field in item:
+                    setattr(post, field, item[field])
+                    fields.add(field)
+            # bulk_update() skips auto_now
+            post.updated_at = now
+
+        Post.objects.bulk_update(posts.values(), sorted(fields))
+        record_rating_changes([
+            (post.author_id, old_ratings[post_id], post.rating) for post_id, post in posts.items()
+        ])
+    transaction.on_commit(bump_generation)
+    return JsonResponse({'posts': [post_to_dict(posts[post_id]) for post_id in ids]})
+
+
+@csrf_exempt
+@require_http_methods(["DELETE"])
+def batch_delete_posts(request):
+    # Check if user is authenticated
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        ids = parse_batch(request, 'ids')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    with transaction.atomic():
+        posts, error = load_own_posts(request.user, ids, 'delete')
+        if error:
+            return error
+
+        deleted = delete_posts(posts.values())
+    transaction.on_commit(bump_generation)
+    return JsonResponse({'message': 'Posts deleted successfully', 'deleted': deleted})
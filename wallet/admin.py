@@ -1,17 +1,38 @@
 from django.contrib import admin
-from .models import Wallet, Transaction
+from myproject.admin_utils import ScalableAdminMixin
+from .models import StripeEvent, Transaction, Wallet
 
 
 @admin.register(Wallet)
-class WalletAdmin(admin.ModelAdmin):
+class WalletAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'balance', 'created_at', 'updated_at')
-    search_fields = ('user__email',)
+    search_fields = ('^user__email',)
+    search_help_text = 'Owner email prefix (case-sensitive).'
+    autocomplete_fields = ('user',)
     readonly_fields = ('created_at', 'updated_at')
+    ordering = ('-id',)
+
+    def get_queryset(self, request):
+        # Wallet.__str__ reads the user's email, including in autocomplete results
+        return super().get_queryset(request).select_related('user')
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('wallet', 'amount', 'transaction_type', 'description', 'created_at')
     list_filter = ('transaction_type', 'created_at')
-    search_fields = ('wallet__user__email', 'description', 'stripe_payment_intent_id')
+    list_select_related = ('wallet__user',)
+    search_fields = ('^wallet__user__email', '=stripe_payment_intent_id')
+    search_help_text = 'Owner email prefix or exact Stripe payment intent id (case-sensitive).'
+    autocomplete_fields = ('wallet',)
     readonly_fields = ('created_at',)
+    # Ids follow creation order and need no extra index to page through
+    ordering = ('-id',)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id',)
+    readonly_fields = ('received_at', 'processed_at')
@@ -0,0 +1,82 @@
+from decimal import Decimal
+import redis
+from django.conf import settings
+from accounts.circuit_breaker import CircuitOpenError
+from accounts.redis_utils import get_async_redis, get_async_script, redis_breaker, redis_client
+
+WALLET_PREFIX = 'wallet:'
+
+# Store a wallet's id and balance under a version (the id of the last ledger
+# row applied), unless the cache already holds a newer one. Write-throughs
+# that reach Redis out of order can then never roll a balance back.
+SET_IF_NEWER_LUA = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '-1')
+if tonumber(ARGV[3]) <= current then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'wallet_id', ARGV[1], 'balance', ARGV[2], 'version', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+set_if_newer = redis_client.register_script(SET_IF_NEWER_LUA)
+
+
+def _key(user_id):
+    return f'{WALLET_PREFIX}{user_id}'
+
+
+def _parse(values):
+    wallet_id, balance = values
+    if wallet_id is None or balance is None:
+        return None
+    return int(wallet_id), Decimal(balance)
+
+
+def get_cached_wallet(user_id):
+    """Return (wallet_id, balance) for a user from Redis, or None on a miss or when Redis is unavailable."""
+    try:
+        return _parse(redis_breaker.call(redis_client.hmget, _key(user_id), 'wallet_id', 'balance'))
+    except (CircuitOpenError, redis.RedisError):
+        return None
+
+
+async def aget_cached_wallet(user_id):
+    """Async version of get_cached_wallet."""
+    try:
+        return _parse(await redis_breaker.acall(get_async_redis().hmget, _key(user_id), 'wallet_id', 'balance'))
+    except (CircuitOpenError, redis.RedisError):
+        return None
+
+
+def cache_wallet(user_id, wallet_id, balance, version):
+    """
+    Write a wallet's balance through to Redis as of ledger row `version`.
+
+    Call it only after the change has committed. A failed write is dropped;
+    WALLET_CACHE_TTL bounds how long the cache can then stay stale.
+    """
+    try:
+        redis_breaker.call(
+            set_if_newer, [_key(user_id)], [wallet_id, str(balance), version or 0, settings.WALLET_CACHE_TTL]
+        )
+    except (CircuitOpenError, redis.RedisError):
+        pass
+
+
+async def acache_wallet(user_id, wallet_id, balance, version):
+    """Async version of cache_wallet."""
+    try:
+        await redis_breaker.acall(
+            get_async_script(SET_IF_NEWER_LUA), [_key(user_id)], [wallet_id, str(balance), version or 0, settings.WALLET_CACHE_TTL]
+        )
+    except (CircuitOpenError, redis.RedisError):
+        pass
+
+
+def evict_wallet(user_id):
+    """Drop a user's cached wallet, for changes made outside deposit/withdraw."""
+    try:
+        redis_breaker.call(redis_client.delete, _key(user_id))
+    except (CircuitOpenError, redis.RedisError):
+        pass
@@ -0,0 +1,142 @@
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .models import BalanceSnapshot, Transaction, Wallet
+
+ZERO = Decimal('0.00')
+
+# Transaction amount with withdrawals counted as negative
+SIGNED_AMOUNT = Case(
+    When(transaction_type='withdrawal', then=-F('amount')),
+    default=F('amount'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def _latest_snapshot_position():
+    """Subquery for the last transaction id covered by the outer wallet's newest snapshot."""
+    latest = BalanceSnapshot.objects.filter(wallet=OuterRef('pk')).order_by('-last_transaction_id')
+    return Coalesce(Subquery(latest.values('last_transaction_id')[:1]), Value(0))
+
+
+def latest_snapshots(wallet_ids=None):
+    """Return {wallet_id: (balance, last_transaction_id)} for each wallet's newest snapshot."""
+    latest = BalanceSnapshot.objects.filter(wallet=OuterRef('wallet')).order_by('-last_transaction_id')
+    snapshots = BalanceSnapshot.objects.filter(
+        last_transaction_id=Subquery(latest.values('last_transaction_id')[:1])
+    )
+    if wallet_ids is not None:
+        snapshots = snapshots.filter(wallet_id__in=wallet_ids)
+    return {
+        wallet_id: (balance, last_id)
+        for wallet_id, balance, last_id in snapshots.values_list('wallet_id', 'balance', 'last_transaction_id')
+    }
+
+
+def _tails(wallet_ids=None):
+    """Rows of (wallet_id, delta, last_id, last_created_at); see ledger_tails."""
+    wallets = Wallet.objects.annotate(covered=_latest_snapshot_position())
+    if wallet_ids is not None:
+        wallets = wallets.filter(id__in=wallet_ids)
+    tail = Transaction.objects.filter(wallet=OuterRef('pk'), id__gt=OuterRef('covered')).order_by().values('wallet')
+    return wallets.order_by().annotate(
+        delta=Subquery(tail.annotate(total=Sum(SIGNED_AMOUNT)).values('total')),
+        last_id=Subquery(tail.annotate(last=Max('id')).values('last')),
+        last_created_at=Subquery(tail.annotate(last=Max('created_at')).values('last')),
+    ).values_list('id', 'delta', 'last_id', 'last_created_at')
+
+
+def ledger_tails(wallet_ids=None):
+    """
+    Sum the transactions not yet covered by a snapshot, per wallet, in one query.
+
+    Each wallet is joined to its newest snapshot position and its tail is
+    read as a range on the (wallet, id) index, so the cost follows the
+    number of new transactions rather than the length of the ledger.
+    Returns {wallet_id: (delta, last_transaction_id, last_created_at)}
+    for wallets that have a tail.
+    """
+    return {
+        wallet_id: (delta, last_id, last_created_at)
+        for wallet_id, delta, last_id, last_created_at in _tails(wallet_ids)
+        if last_id is not None
+    }
+
+
+def _wallet_batches(batch_size):
+    """Yield lists of (wallet_id, balance) in id order."""
+    last_id = 0
+    while True:
+        wallets = list(
+            Wallet.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'balance')[:batch_size]
+        )
+        if not wallets:
+            return
+        yield wallets
+        last_id = wallets[-1][0]
+
+
+def build_snapshots(batch_size=5000):
+    """Snapshot every wallet that has transactions since its last snapshot. Returns the number created."""
+    created = 0
+    for wallets in _wallet_batches(batch_size):
+        wallet_ids = [wallet_id for wallet_id, _ in wallets]
+        snapshots = latest_snapshots(wallet_ids)
+        new = [
+            BalanceSnapshot(
+                wallet_id=wallet_id,
+                balance=snapshots.get(wallet_id, (ZERO, 0))[0] + delta,
+                last_transaction_id=last_id,
+                as_of=last_created_at,
+            )
+            for wallet_id, (delta, last_id, last_created_at) in ledger_tails(wallet_ids).items()
+        ]
+        BalanceSnapshot.objects.bulk_create(new, batch_size=1000, ignore_conflicts=True)
+        created += len(new)
+    return created
+
+
+def balance_at(wallet, when):
+    """Balance of a wallet at a point in time, read from the nearest snapshot plus the ledger tail."""
+    snapshot = wallet.snapshots.filter(as_of__lte=when).order_by('-last_transaction_id').first()
+    base, covered = (snapshot.balance, snapshot.last_transaction_id) if snapshot else (ZERO, 0)
+    tail = wallet.transactions.filter(id__gt=covered, created_at__lte=when).aggregate(
+        delta=Sum(SIGNED_AMOUNT)
+    )['delta']
+    return base + (tail or ZERO)
+
+
+def _ledger_balances(wallet_ids):
+    """Balance implied by snapshots and ledger for each wallet id."""
+    snapshots = latest_snapshots(wallet_ids)
+    tails = ledger_tails(wallet_ids)
+    return {
+        wallet_id: snapshots.get(wallet_id, (ZERO, 0))[0] + tails.get(wallet_id, (ZERO,))[0]
+        for wallet_id in wallet_ids
+    }
+
+
+def reconcile(batch_size=5000):
+    """
+    Compare every Wallet.balance with its latest snapshot plus ledger tail.
+
+    Wallets are checked in batches with three queries each. Returns a list
+    of (wallet_id, stored_balance, ledger_balance) for wallets that
+    disagree.
+    """
+    suspects = []
+    for wallets in _wallet_batches(batch_size):
+        expected = _ledger_balances([wallet_id for wallet_id, _ in wallets])
+        suspects.extend(wallet_id for wallet_id, balance in wallets if expected[wallet_id] != balance)
+
+    # A transaction committed between the queries above can look like drift,
+    # so re-check the suspects before reporting them.
+    if not suspects:
+        return []
+    stored = dict(Wallet.objects.filter(id__in=suspects).values_list('id', 'balance'))
+    expected = _ledger_balances(list(stored))
+    return [
+        (wallet_id, balance, expected[wallet_id])
+        for wallet_id, balance in stored.items()
+        if expected[wallet_id] != balance
+    ]
@@ -0,0 +1,98 @@
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from accounts.models import User
+from posts.models import Post
+from posts.views import create_post
+from wallet.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent post creations at one wallet and check that every fee '
+        'was charged exactly once and the wallet never went negative.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--overdraft', type=int, default=20,
+                            help='How many requests more than the wallet can pay for.')
+        # About a third of what one SQLite worker manages on a laptop; a
+        # regression to full-row saves or lock timeouts drops well below it
+        parser.add_argument('--min-throughput', type=float, default=25,
+                            help='Fail if fewer requests per second than this are served (0 disables the check).')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        affordable = max(0, total - options['overdraft'])
+        cost = Decimal(settings.POST_CREATION_COST)
+
+        user = User.objects.create_user(
+            email=f'bench-{uuid.uuid4().hex}@example.com',
+            password=None,
+            first_name='Bench',
+            last_name='User',
+            dob=date(2000, 1, 1),
+            user_type='editor',
+        )
+        wallet = user.wallet
+        Wallet.objects.filter(pk=wallet.pk).update(balance=cost * affordable)
+
+        factory = RequestFactory()
+        body = json.dumps({'title': 'Benchmark post', 'description': 'Benchmark', 'rating': 3})
+
+        def fire(_):
+            request = factory.post('/posts/create/', body, content_type='application/json')
+            request.user = user
+            try:
+                return create_post(request).status_code
+            finally:
+                connection.close()
+
+        try:
+            with override_settings(POSTS_CACHE_ENABLED=False):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                    statuses = list(pool.map(fire, range(total)))
+                elapsed = time.perf_counter() - start
+
+            wallet.refresh_from_db()
+            created = statuses.count(201)
+            rejected = statuses.count(402)
+            charged = wallet.transactions.filter(transaction_type='withdrawal').count()
+            posts = Post.objects.filter(author=user).count()
+            throughput = total / elapsed
+
+            self.stdout.write(json.dumps({
+                'requests': total,
+                'concurrency': options['concurrency'],
+                'seconds': round(elapsed, 3),
+                'requests_per_second': round(throughput, 1),
+                'created': created,
+                'rejected': rejected,
+                'final_balance': str(wallet.balance),
+            }))
+
+            errors = []
+            if created != affordable or rejected != total - affordable:
+                errors.append(f'expected {affordable} created and {total - affordable} rejected, '
+                              f'got {created} and {rejected} (statuses: {sorted(set(statuses))})')
+            if wallet.balance != Decimal('0.00'):
+                errors.append(f'expected final balance 0.00, got {wallet.balance}')
+            if charged != created or posts != created:
+                errors.append(f'{created} posts accepted but {charged} fees and {posts} posts recorded')
+            if throughput < options['min_throughput']:
+                errors.append(f'throughput {throughput:.1f} req/s below {options["min_throughput"]}')
+            if errors:
+                raise CommandError('; '.join(errors))
+            self.stdout.write(self.style.SUCCESS('Balance and ledger are consistent.'))
+        finally:
+            user.delete()
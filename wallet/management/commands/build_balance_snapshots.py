@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from wallet.ledger import build_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the balance of every wallet with transactions since its last snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        created = build_snapshots(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} snapshot(s).'))
@@ -0,0 +1,29 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from wallet.outbox import process_batch, queue_metrics
+
+
+class Command(BaseCommand):
+    help = 'Apply queued Stripe webhook events to wallets in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty (with --loop).')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and lag, then exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_metrics()))
+            return
+
+        while True:
+            processed = process_batch(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} event(s).')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
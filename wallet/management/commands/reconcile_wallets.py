@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from wallet.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Verify every Wallet.balance against its latest snapshot plus the ledger since then.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        mismatches = reconcile(batch_size=options['batch_size'])
+        for wallet_id, balance, expected in mismatches:
+            self.stderr.write(f'wallet {wallet_id}: balance {balance}, ledger says {expected}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} wallet(s) out of balance.')
+        self.stdout.write(self.style.SUCCESS('All wallets reconcile.'))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('last_transaction_id', models.BigIntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='wallet.wallet')),
+            ],
+            options={
+                'ordering': ['-last_transaction_id'],
+                'indexes': [models.Index(fields=['wallet', 'as_of'], name='snapshot_wallet_as_of_idx')],
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'last_transaction_id'), name='unique_snapshot_position')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def dedupe_payment_intents(apps, schema_editor):
+    """
+    Clear repeated stripe_payment_intent_id values so the column can be made unique.
+
+    Before the outbox a redelivered webhook could credit a payment twice.
+    The earliest row keeps the id. Later copies stay in the ledger, since
+    their amounts are part of the wallet balances, but lose the id and get
+    a note in their description so they can be found and reviewed.
+    Empty strings become NULL, which unique columns allow repeatedly.
+    """
+    Transaction = apps.get_model('wallet', 'Transaction')
+    Transaction.objects.filter(stripe_payment_intent_id='').update(stripe_payment_intent_id=None)
+    duplicated = (
+        Transaction.objects.exclude(stripe_payment_intent_id=None)
+        .values('stripe_payment_intent_id')
+        .annotate(copies=Count('id'), first_id=Min('id'))
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    for row in list(duplicated):
+        intent_id = row['stripe_payment_intent_id']
+        copies = Transaction.objects.filter(stripe_payment_intent_id=intent_id).exclude(id=row['first_id'])
+        for txn in copies:
+            txn.description = f'{txn.description} [duplicate of Stripe payment {intent_id}]'.strip()[:255]
+            txn.stripe_payment_intent_id = None
+            txn.save(update_fields=['description', 'stripe_payment_intent_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0002_balancesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_payment_intents, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='stripe_event_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_stripe_event_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'created_at'], name='txn_wallet_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_transaction_wallet_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'transaction_type', 'created_at'], name='txn_wallet_type_created_at_idx'),
+        ),
+    ]
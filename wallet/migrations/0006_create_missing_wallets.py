@@ -0,0 +1,28 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def create_missing_wallets(apps, schema_editor):
+    """Wallets are now created with the user; give existing users without one a wallet."""
+    User = apps.get_model('accounts', 'User')
+    Wallet = apps.get_model('wallet', 'Wallet')
+    user_ids = User.objects.filter(wallet__isnull=True).values_list('id', flat=True)
+    batch = []
+    for user_id in user_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(Wallet(user_id=user_id))
+        if len(batch) >= BATCH_SIZE:
+            Wallet.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Wallet.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0005_transaction_wallet_type_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_wallets, migrations.RunPython.noop),
+    ]
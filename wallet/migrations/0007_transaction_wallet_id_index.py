@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_create_missing_wallets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'id'], name='txn_wallet_id_idx'),
+        ),
+    ]
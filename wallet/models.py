@@ -1,6 +1,62 @@
 from decimal import Decimal
+from functools import partial
 from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery
 from django.conf import settings
+from django.utils import timezone
+from myproject.db_router import primary_reads
+from .balance_cache import acache_wallet, aget_cached_wallet, cache_wallet, get_cached_wallet
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class WalletManager(models.Manager):
+    def with_versions(self):
+        """Wallets annotated with the id of their last ledger row, read in the same snapshot as the balance."""
+        latest = Transaction.objects.filter(wallet=OuterRef('pk')).order_by('-id').values('id')[:1]
+        return self.annotate(version=Subquery(latest))
+
+    def _from_cache(self, user_id, cached):
+        wallet_id, balance = cached
+        return self.model.from_db(None, ['id', 'user_id', 'balance'], [wallet_id, user_id, balance])
+
+    def for_user(self, user_id):
+        """
+        Return a user's wallet, without a query while its balance is cached.
+
+        On a miss the wallet is read from the primary database and cached
+        for the next request. Only id, user_id and balance are set on a cached
+        wallet; other fields load on first access.
+        """
+        cached = get_cached_wallet(user_id)
+        if cached is not None:
+            return self._from_cache(user_id, cached)
+        wallets = self.with_versions().filter(user_id=user_id)
+        with primary_reads():
+            wallet = wallets.first()
+            if wallet is None:
+                # Users inserted without signals, e.g. with bulk_create. Like the
+                # signal, a concurrent request creating it too is not an error.
+                self.bulk_create([self.model(user_id=user_id)], ignore_conflicts=True)
+                wallet = wallets.get()
+        cache_wallet(user_id, wallet.pk, wallet.balance, wallet.version)
+        return wallet
+
+    async def afor_user(self, user_id):
+        """Async version of for_user."""
+        cached = await aget_cached_wallet(user_id)
+        if cached is not None:
+            return self._from_cache(user_id, cached)
+        wallets = self.with_versions().filter(user_id=user_id)
+        with primary_reads():
+            wallet = await wallets.afirst()
+            if wallet is None:
+                await self.abulk_create([self.model(user_id=user_id)], ignore_conflicts=True)
+                wallet = await wallets.aget()
+        await acache_wallet(user_id, wallet.pk, wallet.balance, wallet.version)
+        return wallet
 
 
 class Wallet(models.Model):
@@ -13,22 +69,35 @@ class Wallet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WalletManager()
+
     def __str__(self):
         return f"{self.user.email}'s wallet - ${self.balance}"
 
-    def deposit(self, amount):
+    def _write_through(self, ledger_row):
+        # Once committed, so a rolled-back change never reaches the cache
+        transaction.on_commit(partial(cache_wallet, self.user_id, self.pk, self.balance, ledger_row.pk))
+
+    def deposit(self, amount, description='Stripe deposit', stripe_payment_intent_id=None):
         """Add funds to wallet."""
+        amount = Decimal(str(amount))
         if amount <= 0:
             raise ValueError("Deposit amount must be positive")
         with transaction.atomic():
-            self.balance += Decimal(str(amount))
-            self.save()
-            Transaction.objects.create(
+            # Increment in the database so concurrent deposits can't overwrite each other
+            Wallet.objects.filter(pk=self.pk).update(
+                balance=F('balance') + amount,
+                updated_at=timezone.now(),
+            )
+            ledger_row = Transaction.objects.create(
                 wallet=self,
-                amount=Decimal(str(amount)),
+                amount=amount,
                 transaction_type='deposit',
-                description='Stripe deposit'
+                description=description,
+                stripe_payment_intent_id=stripe_payment_intent_id
             )
+            self.refresh_from_db(fields=['balance', 'updated_at'])
+            self._write_through(ledger_row)
         return self.balance
 
     def withdraw(self, amount, description='Post creation fee'):
@@ -37,16 +106,24 @@ class Wallet(models.Model):
         if amount <= 0:
             raise ValueError("Withdrawal amount must be positive")
         with transaction.atomic():
-            if self.balance < amount:
-                raise ValueError("Insufficient funds")
-            self.balance -= amount
-            self.save()
-            Transaction.objects.create(
+            # Check and debit in one conditional UPDATE so concurrent
+            # withdrawals can neither lose updates nor overdraw the wallet
+            updated = Wallet.objects.filter(pk=self.pk, balance__gte=amount).update(
+                balance=F('balance') - amount,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                # Report the balance that was actually short, not a cached one
+                self.refresh_from_db(fields=['balance'])
+                raise InsufficientFunds("Insufficient funds")
+            ledger_row = Transaction.objects.create(
                 wallet=self,
                 amount=amount,
                 transaction_type='withdrawal',
                 description=description
             )
+            self.refresh_from_db(fields=['balance', 'updated_at'])
+            self._write_through(ledger_row)
         return self.balance
 
     def has_sufficient_funds(self, amount):
@@ -64,11 +141,68 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     description = models.CharField(max_length=255, blank=True)
-    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True)
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A wallet's history, newest first
+            models.Index(fields=['wallet', 'created_at'], name='txn_wallet_created_at_idx'),
+            # The same, filtered by ?type=
+            models.Index(fields=['wallet', 'transaction_type', 'created_at'], name='txn_wallet_type_created_at_idx'),
+            # Ledger tails after a snapshot position, read as a range per wallet
+            models.Index(fields=['wallet', 'id'], name='txn_wallet_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} - ${self.amount} - {self.created_at}"
+
+
+class BalanceSnapshot(models.Model):
+    """Wallet balance after applying every transaction up to last_transaction_id."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    last_transaction_id = models.BigIntegerField()
+    as_of = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-last_transaction_id']
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'last_transaction_id'], name='unique_snapshot_position'),
+        ]
+        indexes = [
+            models.Index(fields=['wallet', 'as_of'], name='snapshot_wallet_as_of_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id} - ${self.balance} as of {self.as_of}"
+
+
+class StripeEvent(models.Model):
+    """Verified Stripe webhook event waiting to be applied by process_stripe_events."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set after a failure; the event isn't picked up again before then
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='stripe_event_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
@@ -0,0 +1,135 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+from accounts.models import User
+from .balance_cache import cache_wallet
+from .models import StripeEvent, Transaction, Wallet
+
+HANDLED_EVENT_TYPES = ('payment_intent.succeeded',)
+
+
+def enqueue_event(event_id, event_type, payload):
+    """Durably record a verified event; redeliveries of the same event are ignored."""
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event_id, event_type=event_type, payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def _apply(events):
+    """Apply a list of events in the current transaction with a fixed number of queries."""
+    deposits = {}
+    for event in events:
+        if event.event_type != 'payment_intent.succeeded':
+            continue
+        intent = event.payload
+        user_id = intent.get('metadata', {}).get('user_id')
+        if user_id:
+            deposits[intent['id']] = (int(user_id), Decimal(intent['amount']) / 100)
+
+    already_applied = set(
+        Transaction.objects.filter(stripe_payment_intent_id__in=list(deposits))
+        .values_list('stripe_payment_intent_id', flat=True)
+    )
+    user_ids = {user_id for user_id, _ in deposits.values()}
+    existing_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    wallets = dict(Wallet.objects.filter(user_id__in=existing_users).values_list('user_id', 'id'))
+    for user_id in existing_users - set(wallets):
+        wallets[user_id] = Wallet.objects.get_or_create(user_id=user_id)[0].id
+
+    rows = []
+    totals = defaultdict(Decimal)
+    for intent_id, (user_id, amount) in deposits.items():
+        if intent_id in already_applied or user_id not in existing_users:
+            continue
+        wallet_id = wallets[user_id]
+        rows.append(Transaction(
+            wallet_id=wallet_id,
+            amount=amount,
+            transaction_type='deposit',
+            description='Stripe deposit',
+            stripe_payment_intent_id=intent_id,
+        ))
+        totals[wallet_id] += amount
+
+    # The unique stripe_payment_intent_id makes a concurrent double-apply fail here
+    Transaction.objects.bulk_create(rows)
+    now = timezone.now()
+    for wallet_id, total in totals.items():
+        Wallet.objects.filter(pk=wallet_id).update(balance=F('balance') + total, updated_at=now)
+    if totals:
+        # Balances re-read with their last ledger row, so the cache version
+        # never depends on bulk_create() having returned primary keys
+        credited = Wallet.objects.with_versions().filter(pk__in=list(totals)).values_list(
+            'id', 'user_id', 'balance', 'version'
+        )
+        for wallet_id, user_id, balance, version in credited:
+            transaction.on_commit(partial(cache_wallet, user_id, wallet_id, balance, version))
+    StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+        status='processed', processed_at=now, attempts=F('attempts') + 1
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts: exponential, capped."""
+    delay = settings.STRIPE_EVENT_RETRY_DELAY * 2 ** (attempts - 1)
+    return min(delay, settings.STRIPE_EVENT_RETRY_MAX_DELAY)
+
+
+def _record_failure(event, error):
+    attempts = event.attempts + 1
+    StripeEvent.objects.filter(pk=event.pk).update(
+        attempts=attempts,
+        last_error=str(error),
+        status='failed' if attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS else 'pending',
+        next_attempt_at=timezone.now() + timedelta(seconds=retry_delay(attempts)),
+    )
+
+
+def due_events():
+    """Pending events that aren't waiting out a retry delay."""
+    return StripeEvent.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()),
+        status='pending',
+    )
+
+
+def process_batch(batch_size=100):
+    """
+    Apply up to batch_size due events and return how many were picked up.
+
+    The batch is applied in one transaction. If anything in it fails, each
+    event is retried on its own so one bad event can't hold back the rest.
+    An event that still fails waits retry_delay(attempts) before it is
+    picked up again.
+    """
+    events = list(due_events().order_by('id')[:batch_size])
+    if not events:
+        return 0
+    try:
+        with transaction.atomic():
+            _apply(events)
+    except Exception:
+        for event in events:
+            try:
+                with transaction.atomic():
+                    _apply([event])
+            except Exception as e:
+                _record_failure(event, e)
+    return len(events)
+
+
+def queue_metrics():
+    """Queue depth, age of the oldest pending event in seconds, and failed event count."""
+    pending = StripeEvent.objects.filter(status='pending')
+    oldest = pending.aggregate(oldest=Min('received_at'))['oldest']
+    return {
+        'depth': pending.count(),
+        'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+        'failed': StripeEvent.objects.filter(status='failed').count(),
+    }
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .balance_cache import evict_wallet
+from .models import Wallet
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_wallet(sender, instance, created, raw=False, **kwargs):
+    """Give every new user a wallet, so requests never have to create one."""
+    if created and not raw:
+        Wallet.objects.bulk_create([Wallet(user_id=instance.pk)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def evict_cached_wallet(sender, instance, created=False, raw=False, **kwargs):
+    """Balances edited through save() (e.g. in the admin) bypass the write-through; drop the cached copy."""
+    if created or raw:
+        return
+    user_id = instance.user_id
+    transaction.on_commit(lambda: evict_wallet(user_id))
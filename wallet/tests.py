@@ -1,3 +1,357 @@
-from django.test import TestCase
+import base64
+import json
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from accounts.models import User
+from .balance_cache import cache_wallet, evict_wallet, get_cached_wallet
+from .ledger import _tails, build_snapshots, ledger_tails, reconcile
+from .models import BalanceSnapshot, StripeEvent, Transaction, Wallet
+from .outbox import enqueue_event, process_batch, retry_delay
+from . import views
 
-# Create your tests here.
+TRANSACTIONS = 5000
+
+
+def make_user(email):
+    return User.objects.create_user(
+        email=email,
+        password=None,
+        first_name='Test',
+        last_name='User',
+        dob=date(1990, 1, 1),
+        user_type='editor',
+    )
+
+
+def seed_ledger():
+    users = [make_user(f'holder{i}@example.com') for i in range(10)]
+    wallets = [user.wallet for user in users]
+    Transaction.objects.bulk_create(
+        Transaction(
+            wallet=wallets[i % len(wallets)],
+            amount=Decimal('1.00'),
+            transaction_type='deposit',
+            description='Seed',
+            stripe_payment_intent_id=f'pi_seed_{i}',
+        )
+        for i in range(TRANSACTIONS)
+    )
+    return users, wallets
+
+
+class WalletQueryCountTests(TestCase):
+    """Each endpoint must issue a fixed number of queries, however long the ledger."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.wallets = seed_ledger()
+        cls.user = cls.users[0]
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Redis outlives each test's rollback; start from a cold wallet cache
+        for user in self.users:
+            evict_wallet(user.id)
+
+    def get(self, view, path, params=None):
+        request = self.factory.get(path, params)
+        request.user = self.user
+        return view(request)
+
+    def test_get_balance(self):
+        with self.assertNumQueries(1):
+            response = self.get(views.get_balance, '/wallet/balance/')
+        self.assertEqual(response.status_code, 200)
+        # Served from the cache from then on
+        with self.assertNumQueries(0):
+            response = self.get(views.get_balance, '/wallet/balance/')
+        self.assertEqual(Decimal(json.loads(response.content)['balance']), self.wallets[0].balance)
+
+    def test_balance_written_through(self):
+        self.get(views.get_balance, '/wallet/balance/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Wallet.objects.for_user(self.user.id).deposit(Decimal('5.00'))
+        with self.assertNumQueries(0):
+            response = self.get(views.get_balance, '/wallet/balance/')
+        self.assertEqual(Decimal(json.loads(response.content)['balance']), self.wallets[0].balance + 5)
+
+    def test_stale_write_through_ignored(self):
+        cache_wallet(self.user.id, self.wallets[0].id, Decimal('7.00'), 10 ** 9)
+        cache_wallet(self.user.id, self.wallets[0].id, Decimal('3.00'), 1)
+        self.assertEqual(get_cached_wallet(self.user.id), (self.wallets[0].id, Decimal('7.00')))
+
+    def test_wallet_created_with_user(self):
+        user = make_user('newcomer@example.com')
+        self.assertEqual(Wallet.objects.get(user=user).balance, Decimal('0.00'))
+
+    def test_wallet_created_on_miss(self):
+        # Inserted without signals, so the user has no wallet yet
+        user = User.objects.bulk_create([User(
+            email='nosignal@example.com', first_name='No', last_name='Signal', dob=date(1990, 1, 1), user_type='viewer',
+        )])[0]
+        evict_wallet(user.id)
+        wallet = Wallet.objects.for_user(user.id)
+        # A second request whose read missed before the first one created it
+        evict_wallet(user.id)
+        with patch('django.db.models.QuerySet.first', return_value=None):
+            self.assertEqual(Wallet.objects.for_user(user.id).id, wallet.id)
+        self.assertEqual(Wallet.objects.filter(user=user).count(), 1)
+
+    def test_get_balance_at(self):
+        at = (timezone.now() + timedelta(days=1)).isoformat()
+        with self.assertNumQueries(3):
+            response = self.get(views.get_balance_at, '/wallet/balance/at/', {'at': at})
+        self.assertEqual(Decimal(json.loads(response.content)['balance']), Decimal(TRANSACTIONS // 10))
+
+    def test_get_transactions(self):
+        with self.assertNumQueries(2):
+            response = self.get(views.get_transactions, '/wallet/transactions/')
+        self.assertEqual(len(json.loads(response.content)['transactions']), 50)
+
+    def test_transactions_walk_whole_ledger(self):
+        Wallet.objects.for_user(self.user.id)
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 100, 'type': 'deposit', **({'cursor': cursor} if cursor else {})}
+            with self.assertNumQueries(1):
+                data = json.loads(self.get(views.get_transactions, '/wallet/transactions/', params).content)
+            seen += [t['id'] for t in data['transactions']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), TRANSACTIONS // 10)
+        self.assertEqual(len(set(seen)), len(seen))
+
+    def test_transactions_cursor_out_of_range(self):
+        cursor = base64.urlsafe_b64encode(b'{"c":"2024-01-01T00:00:00","i":9223372036854775808,"d":"next"}')
+        response = self.get(views.get_transactions, '/wallet/transactions/', {'cursor': cursor.decode()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_transactions_date_range(self):
+        tomorrow = (timezone.now() + timedelta(days=1)).isoformat()
+        data = json.loads(self.get(views.get_transactions, '/wallet/transactions/', {'from': tomorrow}).content)
+        self.assertEqual(data['transactions'], [])
+        response = self.get(views.get_transactions, '/wallet/transactions/', {'to': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_transactions(self):
+        Wallet.objects.for_user(self.user.id)
+        for fmt, header in (('csv', 1), ('ndjson', 0)):
+            with self.assertNumQueries(1):
+                response = self.get(views.export_transactions, '/wallet/transactions/export/', {'format': fmt})
+                lines = b''.join(response.streaming_content).splitlines()
+            self.assertEqual(len(lines), TRANSACTIONS // 10 + header)
+
+    def test_process_stripe_batch(self):
+        for i in range(50):
+            enqueue_event(f'evt_{i}', 'payment_intent.succeeded', {
+                'id': f'pi_new_{i}',
+                'amount': 100,
+                'metadata': {'user_id': str(self.users[i % 5].id)},
+            })
+        # Independent of batch size: one query per wallet credited on top of a fixed set
+        with self.assertNumQueries(14), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(process_batch(batch_size=50), 50)
+        self.assertFalse(StripeEvent.objects.filter(status='pending').exists())
+        # Credited balances were written through to the cache
+        self.assertEqual(get_cached_wallet(self.users[0].id), (self.wallets[0].id, self.wallets[0].balance + 10))
+        # Cached as of the last ledger row, so a write-through for it is not newer
+        latest = Transaction.objects.filter(wallet=self.wallets[0]).latest('id').id
+        cache_wallet(self.users[0].id, self.wallets[0].id, Decimal('0.00'), latest)
+        self.assertEqual(get_cached_wallet(self.users[0].id), (self.wallets[0].id, self.wallets[0].balance + 10))
+
+
+@override_settings(STRIPE_EVENT_MAX_ATTEMPTS=3, STRIPE_EVENT_RETRY_DELAY=30, STRIPE_EVENT_RETRY_MAX_DELAY=100)
+class StripeRetryTests(TestCase):
+    """A failing event waits out an exponential delay before it is tried again."""
+
+    def test_backoff(self):
+        self.assertEqual([retry_delay(attempts) for attempts in (1, 2, 3, 4)], [30, 60, 100, 100])
+        # An amount that can't be parsed fails on every attempt
+        enqueue_event('evt_bad', 'payment_intent.succeeded', {'id': 'pi_bad', 'amount': 'x', 'metadata': {'user_id': '1'}})
+        event = StripeEvent.objects.get(event_id='evt_bad')
+        for attempt in (1, 2, 3):
+            self.assertEqual(process_batch(), 1)
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=retry_delay(attempt) - 5))
+            # Not picked up again until the delay has passed
+            self.assertEqual(process_batch(), 0)
+            StripeEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(event.status, 'failed')
+        self.assertEqual(process_batch(), 0)
+
+
+class PaymentIntentDedupeMigrationTests(TransactionTestCase):
+    """Making stripe_payment_intent_id unique keeps the ledger and clears repeated ids first."""
+
+    before = [('wallet', '0002_balancesnapshot')]
+    after = [('wallet', '0003_stripe_event_outbox')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_cleared_before_unique(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('accounts', 'User').objects.create(
+            email='dupe@example.com', first_name='D', last_name='Upe', dob=date(1990, 1, 1), user_type='viewer'
+        )
+        wallet = apps.get_model('wallet', 'Wallet').objects.create(user_id=user.id)
+        Transaction = apps.get_model('wallet', 'Transaction')
+        for intent_id in ('pi_1', 'pi_1', 'pi_1', 'pi_2', '', ''):
+            Transaction.objects.create(
+                wallet_id=wallet.id, amount=1, transaction_type='deposit',
+                description='Stripe deposit', stripe_payment_intent_id=intent_id,
+            )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Transaction = executor.loader.project_state(self.after).apps.get_model('wallet', 'Transaction')
+        rows = list(Transaction.objects.order_by('id').values_list('stripe_payment_intent_id', 'description'))
+        self.assertEqual(rows, [
+            ('pi_1', 'Stripe deposit'),
+            (None, 'Stripe deposit [duplicate of Stripe payment pi_1]'),
+            (None, 'Stripe deposit [duplicate of Stripe payment pi_1]'),
+            ('pi_2', 'Stripe deposit'),
+            (None, 'Stripe deposit'),
+            (None, 'Stripe deposit'),
+        ])
+
+
+class SnapshotTests(TestCase):
+    """Snapshots cover the ledger up to a position and only the tail after it is summed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.wallets = seed_ledger()
+
+    def test_tails_start_after_latest_snapshot(self):
+        self.assertEqual(build_snapshots(), len(self.wallets))
+        self.assertEqual(ledger_tails(), {})
+        wallet = self.wallets[0]
+        wallet.deposit(Decimal('5.00'))
+        wallet.withdraw(Decimal('2.00'))
+        (delta, last_id, _), = ledger_tails().values()
+        self.assertEqual((delta, last_id), (Decimal('3.00'), wallet.transactions.order_by('-id')[0].id))
+        self.assertEqual(build_snapshots(), 1)
+        latest = BalanceSnapshot.objects.filter(wallet=wallet).first()
+        self.assertEqual((latest.balance, latest.last_transaction_id), (Decimal('503.00'), last_id))
+
+    def test_reconcile(self):
+        # Seeded rows bypass Wallet.deposit, so the stored balances lag the ledger
+        self.assertEqual(len(reconcile()), len(self.wallets))
+        for wallet in self.wallets:
+            Wallet.objects.filter(pk=wallet.pk).update(balance=Decimal(TRANSACTIONS // len(self.wallets)))
+        build_snapshots()
+        self.assertEqual(reconcile(), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class WalletQueryPlanTests(TestCase):
+    """Hot ledger queries must be served from an index, never a full scan or a sort."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.wallets = seed_ledger()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_wallet_history(self):
+        plan = self.wallets[0].transactions.all()[:50].explain()
+        self.assertIn('USING INDEX txn_wallet_created_at_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_wallet_history_by_type(self):
+        queryset = views.filter_transactions(self.wallets[0].transactions.all(), {'type': 'withdrawal'})
+        plan = queryset.order_by('-created_at', '-id')[:50].explain()
+        self.assertIn('USING INDEX txn_wallet_type_created_at_idx', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_ledger_tails_seek_past_snapshot(self):
+        plan = _tails([wallet.id for wallet in self.wallets]).explain()
+        # Delta, last id and last timestamp are each a range read that starts
+        # at the wallet's snapshot position. SQLite uses the rowid suffix of
+        # the foreign key index; txn_wallet_id_idx gives other backends the same.
+        seeks = re.findall(r'SEARCH U0 USING (?:COVERING )?INDEX \S+ \(wallet_id=\? AND (?:id|rowid)>\?\)', plan)
+        self.assertEqual(len(seeks), 3)
+        self.assertNotIn('SCAN U0', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_payment_intent_lookup(self):
+        plan = Transaction.objects.filter(stripe_payment_intent_id='pi_seed_1').explain()
+        self.assertRegex(plan, r'SEARCH wallet_transaction USING INDEX \S+ \(stripe_payment_intent_id=\?\)')
+
+
+ADMIN_TRANSACTIONS = 1_000_000
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Seeds with a SQLite recursive CTE and reads sqlite_stat1')
+class TransactionAdminTests(TestCase):
+    """Changelists over a million-row ledger never count or scan the whole table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', first_name='Ada', last_name='Admin', dob=date(1990, 1, 1), user_type='editor'
+        )
+        cls.users, cls.wallets = seed_ledger()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO wallet_transaction (wallet_id, amount, transaction_type, description, created_at)
+                WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < %s)
+                SELECT %s, 1, 'withdrawal', 'Bulk', datetime('2024-01-01', '+' || x || ' seconds') FROM n
+                """,
+                [ADMIN_TRANSACTIONS - TRANSACTIONS, cls.wallets[0].id],
+            )
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, params=None):
+        # session, user, count, page
+        with self.assertNumQueries(4) as queries:
+            response = self.client.get('/admin/wallet/transaction/', params)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            if 'COUNT(' in query['sql']:
+                self.assertIn('LIMIT', query['sql'])
+        return response.context['cl']
+
+    def test_unfiltered_count_is_estimated(self):
+        changelist = self.changelist()
+        self.assertEqual(changelist.result_count, ADMIN_TRANSACTIONS)
+        self.assertIsNone(changelist.full_result_count)
+
+    def test_filtered_count_is_capped(self):
+        with self.settings(ADMIN_COUNT_LIMIT=1000):
+            changelist = self.changelist({'transaction_type__exact': 'withdrawal'})
+        self.assertEqual(changelist.result_count, 1000)
+        self.assertTrue(changelist.paginator.count_is_lower_bound)
+
+    def test_indexed_search(self):
+        self.assertEqual(self.changelist({'q': 'pi_seed_7'}).result_count, 1)
+        self.assertEqual(self.changelist({'q': 'holder3@'}).result_count, TRANSACTIONS // 10)
+        # Prefix search is case-sensitive, and the search box says so
+        changelist = self.changelist({'q': 'Seed'})
+        self.assertEqual(changelist.result_count, 0)
+        self.assertIn('case-sensitive', changelist.search_help_text)
+
+    def test_wallet_autocomplete(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/admin/autocomplete/', {
+                'app_label': 'wallet', 'model_name': 'transaction', 'field_name': 'wallet', 'term': 'holder',
+            })
+        self.assertEqual(len(json.loads(response.content)['results']), len(self.wallets))
@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('balance/', views.get_balance, name='wallet_balance'),
-    path('transactions/', views.get_transactions, name='wallet_transactions'),
+    path('balance/', views.aget_balance if settings.ASYNC_VIEWS else views.get_balance, name='wallet_balance'),
+    path('balance/at/', views.get_balance_at, name='wallet_balance_at'),
+    path('transactions/', views.aget_transactions if settings.ASYNC_VIEWS else views.get_transactions,
+         name='wallet_transactions'),
+    path('transactions/export/', views.aexport_transactions if settings.ASYNC_VIEWS else views.export_transactions,
+         name='wallet_transactions_export'),
     path('fund/', views.create_payment_intent, name='wallet_fund'),
     path('webhook/stripe/', views.stripe_webhook, name='stripe_webhook'),
 ]
@@ -1,19 +1,31 @@
+import csv
 import json
 import stripe
 from decimal import Decimal
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from .models import Wallet, Transaction
+from myproject.pagination import akeyset_paginate, keyset_paginate, parse_limit
+from myproject.responses import JsonResponse, aiter_chunks, dumps
+from .ledger import balance_at
+from .outbox import HANDLED_EVENT_TYPES, enqueue_event
+from .models import Transaction, Wallet
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
-def get_or_create_wallet(user):
-    """Get or create wallet for a user."""
-    wallet, _ = Wallet.objects.get_or_create(user=user)
-    return wallet
+def transaction_to_dict(t):
+    """Helper to convert a ledger transaction to a dictionary."""
+    return {
+        'id': t.id,
+        'amount': t.amount,
+        'type': t.transaction_type,
+        'description': t.description,
+        'created_at': t.created_at,
+    }
 
 
 @require_http_methods(["GET"])
@@ -22,36 +34,212 @@ def get_balance(request):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
 
-    wallet = get_or_create_wallet(request.user)
+    wallet = Wallet.objects.for_user(request.user.id)
     return JsonResponse({
-        'balance': str(wallet.balance),
+        'balance': wallet.balance,
         'currency': 'USD'
     })
 
 
+@require_http_methods(["GET"])
+async def aget_balance(request):
+    """Async version of get_balance for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    wallet = await Wallet.objects.afor_user(request.user.id)
+    return JsonResponse({
+        'balance': wallet.balance,
+        'currency': 'USD'
+    })
+
+
+@require_http_methods(["GET"])
+def get_balance_at(request):
+    """Get user's wallet balance at a point in time."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    at = parse_datetime(request.GET.get('at', ''))
+    if at is None:
+        return JsonResponse({'error': 'at must be an ISO 8601 datetime'}, status=400)
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+
+    wallet = Wallet.objects.for_user(request.user.id)
+    return JsonResponse({
+        'balance': balance_at(wallet, at),
+        'currency': 'USD',
+        'at': at
+    })
+
+
+def parse_bound(value, name):
+    if not value:
+        return None
+    at = parse_datetime(value)
+    if at is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+    return timezone.make_aware(at) if timezone.is_naive(at) else at
+
+
+def filter_transactions(queryset, params):
+    """
+    Apply the ?type=, ?from= (inclusive) and ?to= (exclusive) filters.
+
+    Raises ValueError with a message for the client on bad input.
+    """
+    transaction_type = params.get('type')
+    if transaction_type:
+        if transaction_type not in dict(Transaction.TRANSACTION_TYPES):
+            raise ValueError('type must be "deposit" or "withdrawal"')
+        queryset = queryset.filter(transaction_type=transaction_type)
+    start = parse_bound(params.get('from'), 'from')
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    end = parse_bound(params.get('to'), 'to')
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    return queryset
+
+
 @require_http_methods(["GET"])
 def get_transactions(request):
-    """Get user's transaction history."""
+    """Get user's transaction history, newest first, one cursor page at a time."""
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'Authentication required'}, status=401)
 
-    wallet = get_or_create_wallet(request.user)
-    transactions = wallet.transactions.all()[:50]
+    try:
+        limit = parse_limit(request.GET.get('limit'), settings.TRANSACTIONS_PAGE_SIZE,
+                            settings.TRANSACTIONS_MAX_PAGE_SIZE)
+        wallet = Wallet.objects.for_user(request.user.id)
+        transactions, next_cursor, prev_cursor = keyset_paginate(
+            filter_transactions(wallet.transactions.all(), request.GET),
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     return JsonResponse({
-        'transactions': [
-            {
-                'id': t.id,
-                'amount': str(t.amount),
-                'type': t.transaction_type,
-                'description': t.description,
-                'created_at': t.created_at.isoformat()
-            }
-            for t in transactions
-        ]
+        'transactions': [transaction_to_dict(t) for t in transactions],
+        'next': next_cursor,
+        'prev': prev_cursor,
+    })
+
+
+@require_http_methods(["GET"])
+async def aget_transactions(request):
+    """Async version of get_transactions for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    try:
+        limit = parse_limit(request.GET.get('limit'), settings.TRANSACTIONS_PAGE_SIZE,
+                            settings.TRANSACTIONS_MAX_PAGE_SIZE)
+        wallet = await Wallet.objects.afor_user(request.user.id)
+        transactions, next_cursor, prev_cursor = await akeyset_paginate(
+            filter_transactions(wallet.transactions.all(), request.GET),
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'transactions': [transaction_to_dict(t) for t in transactions],
+        'next': next_cursor,
+        'prev': prev_cursor,
     })
 
 
+EXPORT_FIELDS = ('id', 'created_at', 'transaction_type', 'amount', 'description', 'stripe_payment_intent_id')
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for csv.writer in a generator."""
+
+    def write(self, value):
+        return value
+
+
+def stream_transactions(queryset, fmt, chunk_size):
+    """Yield a wallet's ledger oldest first as CSV or NDJSON, one chunk of rows at a time."""
+    rows = queryset.order_by('created_at', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    if fmt == 'ndjson':
+        lines = []
+        for row in rows:
+            lines.append(dumps(dict(zip(EXPORT_FIELDS, row))))
+            if len(lines) >= chunk_size:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row]))
+        if len(lines) >= chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+@require_http_methods(["GET"])
+def export_transactions(request):
+    """Stream the caller's full (optionally filtered) ledger without loading it into memory."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return JsonResponse({'error': 'format must be "csv" or "ndjson"'}, status=400)
+
+    try:
+        wallet = Wallet.objects.for_user(request.user.id)
+        queryset = filter_transactions(wallet.transactions.all(), request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        stream_transactions(queryset, fmt, settings.TRANSACTIONS_EXPORT_CHUNK_SIZE),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="transactions.{fmt}"'
+    return response
+
+
+@require_http_methods(["GET"])
+async def aexport_transactions(request):
+    """Async version of export_transactions for ASGI deployments."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return JsonResponse({'error': 'format must be "csv" or "ndjson"'}, status=400)
+
+    try:
+        wallet = await Wallet.objects.afor_user(request.user.id)
+        queryset = filter_transactions(wallet.transactions.all(), request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        aiter_chunks(stream_transactions(queryset, fmt, settings.TRANSACTIONS_EXPORT_CHUNK_SIZE)),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="transactions.{fmt}"'
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def create_payment_intent(request):
@@ -97,7 +285,7 @@ def create_payment_intent(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def stripe_webhook(request):
-    """Handle Stripe webhook events."""
+    """Verify a Stripe webhook event and queue it for processing."""
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
 
@@ -110,32 +298,8 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return JsonResponse({'error': 'Invalid signature'}, status=400)
 
-    # Handle the payment_intent.succeeded event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        user_id = payment_intent['metadata'].get('user_id')
-
-        if user_id:
-            from accounts.models import User
-            try:
-                user = User.objects.get(id=user_id)
-                wallet = get_or_create_wallet(user)
-                amount = Decimal(payment_intent['amount']) / 100
-
-                # Check if transaction already exists (idempotency)
-                if not Transaction.objects.filter(
-                    stripe_payment_intent_id=payment_intent['id']
-                ).exists():
-                    wallet.balance += amount
-                    wallet.save()
-                    Transaction.objects.create(
-                        wallet=wallet,
-                        amount=amount,
-                        transaction_type='deposit',
-                        description='Stripe deposit',
-                        stripe_payment_intent_id=payment_intent['id']
-                    )
-            except User.DoesNotExist:
-                pass
+    # Queue the event and acknowledge right away; process_stripe_events applies it
+    if event['type'] in HANDLED_EVENT_TYPES:
+        enqueue_event(event['id'], event['type'], json.loads(payload)['data']['object'])
 
     return JsonResponse({'status': 'success'})